@@ -0,0 +1,248 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Command line tool for warming caches and benchmarking.
+
+Run python -m mir.anidb --help for usage.
+"""
+
+import argparse
+import io
+import logging
+import math
+import os
+from pathlib import Path
+import pickle
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from mir.anidb import anime
+from mir.anidb import api
+from mir.anidb import titles
+
+logger = logging.getLogger(__name__)
+
+_PROTOCOL = 4
+
+
+def main(argv=None):
+    parser = _make_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not hasattr(args, 'func'):
+        parser.print_help()
+        return 2
+    return args.func(args)
+
+
+def _make_parser():
+    parser = argparse.ArgumentParser(prog='python -m mir.anidb')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    subparsers = parser.add_subparsers()
+
+    p = subparsers.add_parser(
+        'warm-titles', help='Fetch titles and save them to a pickle cache.')
+    p.add_argument('cache', type=Path)
+    p.add_argument('--copy', type=Path,
+                   help='Also save a copy of the titles XML here.')
+    p.set_defaults(func=_warm_titles)
+
+    p = subparsers.add_parser(
+        'warm-anime', help='Fetch anime and save them to a cache directory.')
+    p.add_argument('dir', type=Path)
+    p.add_argument('aids', type=int, nargs='*',
+                   help='Anime IDs; read from stdin if omitted.')
+    p.add_argument('--client', required=True)
+    p.add_argument('--clientver', type=int, required=True)
+    p.add_argument('--interval', type=float, default=2,
+                   help='Minimum seconds between requests (default 2).')
+    p.add_argument('--force', action='store_true',
+                   help='Fetch anime that are already cached.')
+    p.set_defaults(func=_warm_anime)
+
+    p = subparsers.add_parser(
+        'search-titles', help='Search titles in a local XML or pickle dump.')
+    p.add_argument('dump', type=Path)
+    p.add_argument('query')
+    p.set_defaults(func=_search_titles)
+
+    p = subparsers.add_parser(
+        'bench', help='Benchmark titles parsing and caching.')
+    p.add_argument('xml', type=Path)
+    p.add_argument('-n', '--repeat', type=int, default=5)
+    p.set_defaults(func=_bench)
+    return parser
+
+
+def _warm_titles(args):
+    start = time.perf_counter()
+    etree = titles._request_titles_xml()
+    if args.copy is not None:
+        with args.copy.open('wb') as file:
+            etree.write(file)
+    titles_list = list(titles._unpack_titles(etree))
+    titles._save_pickle(args.cache, titles_list)
+    elapsed = time.perf_counter() - start
+    print(f'cached {len(titles_list)} titles in {elapsed:.3f}s')
+    return 0
+
+
+def anime_cache_path(dir: Path, aid: int) -> Path:
+    """Return the path of the cached anime pickle for an aid."""
+    return dir / f'{aid}.pickle'
+
+
+def _warm_anime(args):
+    client = api.Client(args.client, args.clientver)
+    aids = args.aids or [int(line) for line in sys.stdin if line.strip()]
+    args.dir.mkdir(parents=True, exist_ok=True)
+    limiter = _RateLimiter(args.interval)
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+    for aid in aids:
+        path = anime_cache_path(args.dir, aid)
+        if path.exists() and not args.force:
+            logger.info('Skipping cached anime %d', aid)
+            continue
+        limiter.wait()
+        request_start = time.perf_counter()
+        try:
+            result = anime.request_anime(client, aid)
+        except api.APIError:
+            # Errors such as a ban apply to every request, so keeping
+            # on would only make things worse.
+            logger.exception('AniDB error for anime %d, stopping', aid)
+            failed += 1
+            break
+        except (ET.ParseError, anime.MissingElementError, ValueError):
+            logger.exception('Failed to parse anime %d', aid)
+            failed += 1
+            continue
+        latencies.append(time.perf_counter() - request_start)
+        _dump_pickle(path, result)
+    elapsed = time.perf_counter() - start
+    _print_stats('fetch', latencies, elapsed)
+    print(f'rate limit wait: {limiter.waited:.3f}s')
+    print(f'failed: {failed}')
+    return 1 if failed else 0
+
+
+def _search_titles(args):
+    titles_list = _load_titles_dump(args.dump)
+    query = args.query.casefold()
+    for entry in titles_list:
+        for title in entry.titles:
+            if query in title.title.casefold():
+                print(f'{entry.aid}\t{title.type}\t{title.lang}\t{title.title}')
+    return 0
+
+
+def _load_titles_dump(path: Path) -> 'List[Titles]':
+    """Load Titles from a titles XML copy or pickle cache."""
+    with path.open('rb') as file:
+        data = file.read()
+    if data.lstrip().startswith(b'<'):
+        etree = api.unpack_xml(data.decode('utf-8'))
+        return list(titles._unpack_titles(etree))
+    return pickle.loads(data)
+
+
+def _bench(args):
+    text = args.xml.read_text('utf-8')
+    parse_times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        titles_list = list(titles._unpack_titles(api.unpack_xml(text)))
+        parse_times.append(time.perf_counter() - start)
+    _print_stats('parse', parse_times, sum(parse_times),
+                 items=len(titles_list) * args.repeat)
+
+    save_times = []
+    load_times = []
+    for _ in range(args.repeat):
+        file = io.BytesIO()
+        start = time.perf_counter()
+        pickle.dump(titles_list, file, protocol=_PROTOCOL)
+        save_times.append(time.perf_counter() - start)
+        file.seek(0)
+        start = time.perf_counter()
+        pickle.load(file)
+        load_times.append(time.perf_counter() - start)
+    _print_stats('cache save', save_times, sum(save_times))
+    _print_stats('cache load', load_times, sum(load_times))
+    return 0
+
+
+class _RateLimiter:
+
+    """Enforce a minimum interval between calls to wait()."""
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._last = None
+        self.waited = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if self._last is not None:
+            delay = self._last + self._interval - now
+            if delay > 0:
+                time.sleep(delay)
+                self.waited += delay
+                now += delay
+        self._last = now
+
+
+def _dump_pickle(path: Path, obj):
+    """Write a pickle file atomically, as titles._save_pickle does."""
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with tmp.open('wb') as file:
+            pickle.dump(obj, file, protocol=_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+
+def _print_stats(name, latencies, elapsed, items=None):
+    if items is None:
+        items = len(latencies)
+    rate = items / elapsed if elapsed else math.inf
+    print(f'{name}: {items} items in {elapsed:.3f}s ({rate:.1f}/s)')
+    if latencies:
+        percentiles = ' '.join(
+            f'p{p}={_percentile(latencies, p) * 1000:.1f}ms'
+            for p in (50, 90, 99))
+        print(f'{name} latency: {percentiles}')
+
+
+def _percentile(values, p):
+    """Return the nearest-rank percentile of values.
+
+    >>> _percentile([1, 2, 3, 4], 50)
+    2
+    >>> _percentile([1, 2, 3, 4], 99)
+    4
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+if __name__ == '__main__':
+    sys.exit(main())
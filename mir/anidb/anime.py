@@ -24,11 +24,24 @@ from mir.anidb import api
 from mir.anidb._xmlns import XML
 
 
-def request_anime(client, aid: int) -> 'Anime':
-    """Make an anime API request."""
-    response = api.httpapi_request(client, request='anime', aid=aid)
+def request_anime(client, aid: int, archive=None, deadline=None) -> 'Anime':
+    """Make an anime API request.
+
+    If archive is given, the raw response XML is saved with
+    archive.save(aid, text) (see mir.anidb.archive).
+
+    deadline is a time.monotonic() value (see api.deadline_after)
+    covering the transfer and parsing.  api.RequestTimeoutError is
+    raised if it passes.
+    """
+    response = api.httpapi_request(client, request='anime', aid=aid,
+                                   deadline=deadline)
     etree = api.unpack_xml(response.text)
-    return _unpack_anime(etree.getroot())
+    if archive is not None:
+        archive.save(aid, response.text)
+    result = _unpack_anime(etree.getroot())
+    api.check_deadline(deadline)
+    return result
 
 
 class Anime(NamedTuple):
@@ -96,6 +109,69 @@ def get_episode_title(episode: Episode) -> int:
         return episode.titles[0].title
 
 
+class EpisodeIndex:
+
+    """Precomputed lookup tables for the episodes of an anime.
+
+    Build this once per Anime and reuse it instead of scanning
+    Anime.episodes and calling get_episode_number or get_episode_title
+    repeatedly.
+    """
+
+    def __init__(self, anime: Anime):
+        self._aid = anime.aid
+        self._by_epno = {}
+        self._by_number = {}
+        self._by_type = {}
+        self._titles = {}
+        for episode in anime.episodes:
+            number = get_episode_number(episode)
+            self._by_epno[episode.epno] = episode
+            self._by_number[episode.type, number] = episode
+            self._by_type.setdefault(episode.type, []).append((number, episode))
+        self._by_type = {
+            type: tuple(episode for number, episode in sorted(
+                episodes, key=lambda pair: pair[0]))
+            for type, episodes in self._by_type.items()
+        }
+
+    def __repr__(self):
+        cls = type(self).__qualname__
+        return f'<{cls} aid={self._aid} episodes={len(self._by_epno)}>'
+
+    def __len__(self):
+        return len(self._by_epno)
+
+    def get(self, type: int, number: int) -> 'Optional[Episode]':
+        """Get an episode by type code and episode number."""
+        return self._by_number.get((type, number))
+
+    def get_epno(self, epno: str) -> 'Optional[Episode]':
+        """Get an episode by epno."""
+        return self._by_epno.get(epno)
+
+    def episodes_of_type(self, type: int) -> 'Tuple[Episode]':
+        """Get the episodes of a type, sorted by episode number."""
+        return self._by_type.get(type, ())
+
+    def title(self, epno: str) -> 'Optional[str]':
+        """Get the preferred title of an episode by epno.
+
+        See get_episode_title.  Returns None if there is no such episode
+        or it has no titles.  Titles are computed on first use.
+        """
+        try:
+            return self._titles[epno]
+        except KeyError:
+            pass
+        episode = self._by_epno.get(epno)
+        title = None
+        if episode is not None and episode.titles:
+            title = get_episode_title(episode)
+        self._titles[epno] = title
+        return title
+
+
 def get_main_title(titles: 'Iterable[AnimeTitle]'):
     """Get the main anime title."""
     for title in titles:
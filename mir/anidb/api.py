@@ -15,44 +15,321 @@
 """Low level API for AniDB.
 
 https://wiki.anidb.net/w/API
+
+requests is imported on first use, so that parsing local XML does not
+pay for loading the network stack.
 """
 
 import io
+import logging
+import os
+from pathlib import Path
+import time
 from typing import NamedTuple
+from typing import Tuple
 import xml.etree.ElementTree as ET
 
-import requests
-
 _TITLES = 'http://anidb.net/api/anime-titles.xml.gz'
 _HTTPAPI = 'http://api.anidb.net:9001/httpapi'
+_CHUNK_SIZE = 1 << 16
+_READ_SIZE = 1 << 12
+_GZIP_MAGIC = b'\x1f\x8b'
+
+logger = logging.getLogger(__name__)
+
+# Default (connect, read) timeouts in seconds.
+DEFAULT_TIMEOUT = (10, 30)
 
 
-def titles_request() -> 'Response':
+def titles_request(timeout=DEFAULT_TIMEOUT, deadline=None) -> 'Response':
     """Request titles.
 
+    timeout is a (connect, read) tuple as for requests.  deadline is a
+    time.monotonic() value (see deadline_after); if the response is not
+    complete by then, RequestTimeoutError is raised.
+
     https://wiki.anidb.net/w/API#Anime_Titles
     """
-    return requests.get(_TITLES)
+    return _get(_TITLES, timeout=timeout, deadline=deadline)
+
+
+def download_titles(path: 'PathLike', timeout=DEFAULT_TIMEOUT,
+                    retries: int = 3) -> Path:
+    """Download the titles dump to a file.
+
+    The response body is saved as sent (normally gzip compressed) to a
+    .part file next to path, and the response's ETag or Last-Modified
+    header to a .part.validator file.  If the transfer is interrupted,
+    it is resumed with an HTTP Range request guarded by If-Range, up to
+    retries times; a .part file left by an earlier call is resumed too.
+    If the dump changed in the meantime, the server sends it whole and
+    the download starts over.  Once complete, the size and gzip trailer
+    are checked and the file is renamed to path.
+
+    Raises DownloadError if the download fails or is corrupt.  Client
+    errors (4xx responses) are not retried.
+
+    https://wiki.anidb.net/w/API#Anime_Titles
+    """
+    import requests
+    import urllib3
+    path = Path(path)
+    part = path.with_name(f'{path.name}.part')
+    validator = path.with_name(f'{path.name}.part.validator')
+    for attempt in range(retries + 1):
+        try:
+            total = _download_remaining(part, validator, timeout)
+            break
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code < 500:
+                raise DownloadError(f'download failed: {e}') from e
+            if attempt == retries:
+                raise DownloadError(f'download failed: {e}') from e
+            logger.info('Titles download failed, retrying: %s', e)
+        except (requests.RequestException, urllib3.exceptions.HTTPError,
+                ConnectionError) as e:
+            if attempt == retries:
+                raise DownloadError(f'download failed: {e}') from e
+            logger.info('Titles download interrupted, resuming: %s', e)
+    try:
+        _verify_download(part, total)
+    except DownloadError:
+        part.unlink()
+        raise
+    finally:
+        _unlink_missing_ok(validator)
+    os.replace(part, path)
+    return path
+
+
+def _download_remaining(part: Path, validator: Path,
+                        timeout) -> 'Optional[int]':
+    """Download the rest of the titles dump into a .part file.
+
+    A .part file is only resumed if validator holds the ETag or
+    Last-Modified value it was downloaded with; otherwise it is
+    downloaded again from the start.
+
+    Returns the total size of the dump if the server reported it.
+    """
+    import requests
+    offset = part.stat().st_size if part.exists() else 0
+    if_range = validator.read_text() if validator.exists() else None
+    headers = {}
+    if offset and if_range:
+        headers = {'Range': f'bytes={offset}-', 'If-Range': if_range}
+    elif offset:
+        logger.info('Discarding %s without a validator', part)
+    with requests.get(_TITLES, headers=headers, timeout=timeout,
+                      stream=True) as response:
+        if response.status_code == 416 and headers:
+            # Range not satisfiable: the .part file is already complete.
+            return None
+        response.raise_for_status()
+        if response.status_code == 206 and headers:
+            mode = 'ab'
+            total = _parse_content_range_total(
+                response.headers.get('Content-Range', ''))
+        else:
+            mode = 'wb'
+            length = response.headers.get('Content-Length')
+            total = int(length) if length is not None else None
+            _save_validator(validator, response.headers)
+        with part.open(mode) as file:
+            for chunk in response.raw.stream(_CHUNK_SIZE,
+                                             decode_content=False):
+                file.write(chunk)
+    return total
+
+
+def _save_validator(path: Path, headers):
+    """Save the validator to resume a response with, if it has one.
+
+    Weak ETags cannot be used with If-Range, so Last-Modified is used
+    instead.
+    """
+    etag = headers.get('ETag')
+    if etag is not None and etag.startswith('W/'):
+        etag = None
+    value = etag or headers.get('Last-Modified')
+    if value is None:
+        _unlink_missing_ok(path)
+    else:
+        path.write_text(value)
+
+
+def _unlink_missing_ok(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _parse_content_range_total(value: str) -> 'Optional[int]':
+    """Get the total size from a Content-Range header.
+
+    >>> _parse_content_range_total('bytes 10-99/100')
+    100
+    >>> _parse_content_range_total('bytes 10-99/*') is None
+    True
+    """
+    _, _, total = value.rpartition('/')
+    return int(total) if total.isdigit() else None
+
+
+def _verify_download(path: Path, total: 'Optional[int]'):
+    """Check a downloaded file's size and, if gzip, its trailer."""
+    size = path.stat().st_size
+    if total is not None and size != total:
+        raise DownloadError(f'expected {total} bytes, got {size}')
+    with path.open('rb') as file:
+        magic = file.read(len(_GZIP_MAGIC))
+    if magic != _GZIP_MAGIC:
+        return
+    import gzip
+    try:
+        with gzip.open(path) as file:
+            while file.read(_CHUNK_SIZE):
+                pass
+    except (OSError, EOFError) as e:
+        raise DownloadError(f'corrupt gzip data: {e}') from e
 
 
 class Client(NamedTuple):
     name: str
     version: int
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT
 
 
-def httpapi_request(client, **params) -> 'Response':
+def httpapi_request(client, *, deadline=None, **params) -> 'Response':
     """Send a request to AniDB HTTP API.
 
+    client.timeout is used for the connection.  deadline is as for
+    titles_request.
+
     https://wiki.anidb.net/w/HTTP_API_Definition
     """
-    return requests.get(
+    return _get(
         _HTTPAPI,
         params={
             'client': client.name,
             'clientver': client.version,
             'protover': 1,
             **params
-        })
+        },
+        timeout=client.timeout,
+        deadline=deadline)
+
+
+def deadline_after(seconds: float) -> float:
+    """Return a deadline the given number of seconds from now."""
+    return time.monotonic() + seconds
+
+
+def check_deadline(deadline: 'Optional[float]') -> 'Optional[float]':
+    """Check that a deadline has not passed.
+
+    Returns the remaining seconds, or None if deadline is None.
+    Raises RequestTimeoutError if the deadline has passed.
+
+    >>> check_deadline(None) is None
+    True
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise RequestTimeoutError('deadline exceeded')
+    return remaining
+
+
+def _get(url, *, params=None, timeout, deadline) -> 'Response':
+    """Send a GET request, enforcing timeouts and an overall deadline.
+
+    When there is a deadline, the body is streamed by _read_body so the
+    deadline is also enforced during the transfer.  requests has no
+    public way to hand it a body read like this, so the streamed bytes
+    are stored in Response._content, which is where Response.content
+    caches the body; text and content then work as for a non-streamed
+    response.
+    """
+    import requests
+    remaining = check_deadline(deadline)
+    if remaining is not None:
+        timeout = _clamp_timeout(timeout, remaining)
+    try:
+        response = requests.get(url, params=params, timeout=timeout,
+                                stream=deadline is not None)
+        if deadline is not None:
+            with response:
+                response._content = _read_body(response, deadline)
+    except requests.Timeout as e:
+        raise RequestTimeoutError(str(e)) from e
+    except requests.ConnectionError as e:
+        if _is_read_timeout(e):
+            raise RequestTimeoutError(str(e)) from e
+        raise
+    return response
+
+
+def _read_body(response, deadline: float) -> bytes:
+    """Read a streamed response body before a deadline.
+
+    The body is read in pieces of whatever has arrived (at most
+    _READ_SIZE bytes), so a server trickling data cannot hold a read
+    past the deadline, and the socket timeout is cut to the remaining
+    time before each read.  urllib3 errors are reraised as the
+    requests exceptions Response.iter_content would raise.
+    """
+    import requests
+    import urllib3
+    chunks = []
+    sock = getattr(response.raw.connection, 'sock', None)
+    try:
+        while True:
+            remaining = check_deadline(deadline)
+            if sock is not None:
+                sock.settimeout(min(remaining, sock.gettimeout() or remaining))
+            chunk = response.raw.read1(_READ_SIZE, decode_content=True)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except urllib3.exceptions.ReadTimeoutError as e:
+        raise RequestTimeoutError(str(e)) from e
+    except urllib3.exceptions.ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e) from e
+    except urllib3.exceptions.DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e) from e
+    except urllib3.exceptions.SSLError as e:
+        raise requests.exceptions.SSLError(e) from e
+    return b''.join(chunks)
+
+
+def _is_read_timeout(error: Exception) -> bool:
+    """Check if a requests.ConnectionError was caused by a read timeout.
+
+    While reading the body, requests reraises urllib3's ReadTimeoutError
+    as a ConnectionError instead of a Timeout.
+    """
+    from urllib3.exceptions import ReadTimeoutError
+    causes = (*error.args, error.__cause__, error.__context__)
+    return any(isinstance(cause, ReadTimeoutError) for cause in causes)
+
+
+def _clamp_timeout(timeout, remaining: float) -> 'Tuple[float, float]':
+    """Clamp a requests timeout to the remaining time.
+
+    >>> _clamp_timeout((10, 30), 20)
+    (10, 20)
+    >>> _clamp_timeout(None, 5)
+    (5, 5)
+    """
+    if timeout is None:
+        return (remaining, remaining)
+    if not isinstance(timeout, tuple):
+        timeout = (timeout, timeout)
+    return tuple(remaining if t is None else min(t, remaining)
+                 for t in timeout)
 
 
 def unpack_xml(text) -> ET.ElementTree:
@@ -70,3 +347,11 @@ def _check_for_errors(etree: ET.ElementTree):
 
 class APIError(Exception):
     """AniDB API error."""
+
+
+class DownloadError(Exception):
+    """Download failed or was corrupt."""
+
+
+class RequestTimeoutError(TimeoutError):
+    """Request timed out or its deadline passed."""
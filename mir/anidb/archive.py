@@ -0,0 +1,166 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Archive of raw anime API responses.
+
+Pass an AnimeArchive to anime.request_anime to keep a copy of each
+response, then use replay to parse the archive again without making
+any API requests.
+"""
+
+import datetime
+import gzip
+import logging
+import os
+from pathlib import Path
+from typing import NamedTuple
+import xml.etree.ElementTree as ET
+
+from mir.anidb import anime
+from mir.anidb import api
+
+logger = logging.getLogger(__name__)
+
+_SUFFIX = '.xml.gz'
+_TIME_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+
+
+class ArchiveEntry(NamedTuple):
+    aid: int
+    fetched: datetime.datetime
+    path: Path
+
+
+class AnimeArchive:
+
+    """Directory of gzip compressed anime XML responses.
+
+    Files are named by aid and UTC fetch time, for example
+    22_20200101T000000.000000Z.xml.gz.
+    """
+
+    def __init__(self, path: 'PathLike'):
+        self._path = Path(path)
+
+    def __repr__(self):
+        cls = type(self).__qualname__
+        return f'{cls}({str(self._path)!r})'
+
+    def save(self, aid: int, text: str,
+             fetched: datetime.datetime = None) -> ArchiveEntry:
+        """Save an anime XML response.
+
+        fetched defaults to now.  It is converted to UTC for the file
+        name; a naive datetime is taken to be local time.
+        """
+        if fetched is None:
+            fetched = datetime.datetime.now(datetime.timezone.utc)
+        fetched = fetched.astimezone(datetime.timezone.utc)
+        self._path.mkdir(parents=True, exist_ok=True)
+        path = self._path / f'{aid}_{fetched.strftime(_TIME_FORMAT)}{_SUFFIX}'
+        tmp = path.with_name(f'.{path.name}.tmp')
+        with gzip.open(tmp, 'wt', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp, path)
+        return ArchiveEntry(aid=aid, fetched=fetched, path=path)
+
+    def entries(self) -> 'Iterable[ArchiveEntry]':
+        """Iterate over all archived responses."""
+        if not self._path.exists():
+            return
+        for path in self._path.iterdir():
+            entry = _parse_entry(path)
+            if entry is not None:
+                yield entry
+
+    def latest(self) -> 'Dict[int, ArchiveEntry]':
+        """Return the most recently fetched response for each aid."""
+        latest = {}
+        for entry in self.entries():
+            current = latest.get(entry.aid)
+            if current is None or entry.fetched > current.fetched:
+                latest[entry.aid] = entry
+        return latest
+
+
+def _parse_entry(path: Path) -> 'Optional[ArchiveEntry]':
+    """Parse an archive file name.
+
+    Returns None if the file is not an archived response.
+
+    >>> _parse_entry(Path('22_20200101T000000.000000Z.xml.gz')).aid
+    22
+    >>> _parse_entry(Path('.22_20200101T000000.000000Z.xml.gz.tmp')) is None
+    True
+    """
+    name = path.name
+    if not name.endswith(_SUFFIX):
+        return None
+    aid, _, fetched = name[:-len(_SUFFIX)].partition('_')
+    try:
+        return ArchiveEntry(
+            aid=int(aid),
+            fetched=datetime.datetime.strptime(fetched, _TIME_FORMAT)
+            .replace(tzinfo=datetime.timezone.utc),
+            path=path,
+        )
+    except ValueError:
+        return None
+
+
+def load_entry(entry: ArchiveEntry) -> anime.Anime:
+    """Parse an archived response into an Anime."""
+    with gzip.open(entry.path, 'rt', encoding='utf-8') as file:
+        text = file.read()
+    etree = api.unpack_xml(text)
+    return anime._unpack_anime(etree.getroot())
+
+
+def replay(archive: AnimeArchive, processes: int = 0) -> 'List[Anime]':
+    """Parse the latest archived response for every aid.
+
+    Responses are parsed with a process pool of the given size (0 means
+    one per CPU).  The result is sorted by aid.  Entries that cannot be
+    parsed, such as archived error responses or corrupt files, are
+    logged and skipped.
+    """
+    entries = [entry for aid, entry in sorted(archive.latest().items())]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(entries) <= 1:
+        results = map(_try_load_entry, entries)
+        return _collect(entries, results)
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(len(entries) // (processes * 4), 1)
+    with ProcessPoolExecutor(processes) as executor:
+        results = executor.map(_try_load_entry, entries, chunksize=chunksize)
+        return _collect(entries, results)
+
+
+def _try_load_entry(entry: ArchiveEntry) -> 'Tuple[Optional[Anime], str]':
+    """Parse an archived response, returning (anime, error message)."""
+    try:
+        return load_entry(entry), ''
+    except (api.APIError, ET.ParseError, anime.MissingElementError,
+            OSError, EOFError) as e:
+        return None, f'{type(e).__name__}: {e}'
+
+
+def _collect(entries, results) -> 'List[Anime]':
+    collected = []
+    for entry, (record, error) in zip(entries, results):
+        if record is None:
+            logger.warning('Skipping archived anime %s: %s', entry.path, error)
+        else:
+            collected.append(record)
+    return collected
@@ -0,0 +1,192 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local catalog of Anime records.
+
+The catalog is an SQLite database keyed by aid, with indexes on type,
+startdate, enddate and episodecount so queries on those fields do not
+scan or load every record.
+"""
+
+from pathlib import Path
+import pickle
+import sqlite3
+
+_PROTOCOL = 4
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS anime (
+    aid INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    startdate TEXT,
+    enddate TEXT,
+    episodecount INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS anime_type ON anime (type, startdate);
+CREATE INDEX IF NOT EXISTS anime_startdate ON anime (startdate);
+CREATE INDEX IF NOT EXISTS anime_enddate ON anime (enddate);
+CREATE INDEX IF NOT EXISTS anime_episodecount ON anime (episodecount);
+'''
+
+
+class Catalog:
+
+    """Persistent store of Anime records.
+
+    path is the SQLite database file, which is created if missing.
+    Catalog can be used as a context manager to close it.
+    """
+
+    def __init__(self, path: 'PathLike'):
+        self._path = Path(path)
+        self._conn = sqlite3.connect(str(self._path))
+        self._conn.executescript(_SCHEMA)
+
+    def __repr__(self):
+        cls = type(self).__qualname__
+        return f'{cls}({str(self._path)!r})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        (count,), = self._conn.execute('SELECT COUNT(*) FROM anime')
+        return count
+
+    def close(self):
+        self._conn.close()
+
+    def upsert(self, anime: 'Iterable[Anime]') -> int:
+        """Insert or replace Anime records in one transaction.
+
+        Returns the number of records written.
+        """
+        rows = [_to_row(record) for record in anime]
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO anime'
+                ' (aid, type, startdate, enddate, episodecount, data)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                rows)
+        return len(rows)
+
+    def get(self, aid: int) -> 'Optional[Anime]':
+        """Get an Anime by aid."""
+        row = self._conn.execute(
+            'SELECT data FROM anime WHERE aid = ?', (aid,)).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def delete(self, aid: int):
+        """Delete an Anime by aid."""
+        with self._conn:
+            self._conn.execute('DELETE FROM anime WHERE aid = ?', (aid,))
+
+    def query(self, **filters) -> 'Iterable[Anime]':
+        """Query Anime records, ordered by aid.
+
+        Supported filters:
+
+        type -- exact anime type, e.g. 'TV Series'
+        started_after, started_before -- inclusive startdate range
+        ended_after, ended_before -- inclusive enddate range
+        airing_between -- (start, end) tuple; matches anime whose run
+            overlaps the range, treating a missing enddate as ongoing
+        ongoing -- if true, only anime without an enddate; if false,
+            only anime with one
+        min_episodes, max_episodes -- inclusive episodecount range
+        """
+        where, params = _build_where(filters)
+        cursor = self._conn.execute(
+            f'SELECT data FROM anime{where} ORDER BY aid', params)
+        return _unpickle_rows(cursor)
+
+    def aids(self, **filters) -> 'List[int]':
+        """Return the aids matching the filters, as for query."""
+        where, params = _build_where(filters)
+        cursor = self._conn.execute(
+            f'SELECT aid FROM anime{where} ORDER BY aid', params)
+        return [aid for aid, in cursor]
+
+
+def _unpickle_rows(cursor) -> 'Iterable[Anime]':
+    for data, in cursor:
+        yield pickle.loads(data)
+
+
+def _to_row(anime: 'Anime') -> tuple:
+    return (
+        anime.aid,
+        anime.type,
+        _format_date(anime.startdate),
+        _format_date(anime.enddate),
+        anime.episodecount,
+        pickle.dumps(anime, protocol=_PROTOCOL),
+    )
+
+
+def _build_where(filters: dict) -> 'Tuple[str, list]':
+    """Build an SQL WHERE clause from query filters.
+
+    >>> _build_where({'type': 'Movie', 'min_episodes': 2})
+    (' WHERE type = ? AND episodecount >= ?', ['Movie', 2])
+    >>> _build_where({})
+    ('', [])
+    """
+    clauses = []
+    params = []
+    filters = dict(filters)
+    missing = sorted(name for name, value in filters.items() if value is None)
+    if missing:
+        raise TypeError(f'filters cannot be None: {", ".join(missing)}')
+
+    def add(clause, *values):
+        clauses.append(clause)
+        params.extend(values)
+
+    if 'type' in filters:
+        add('type = ?', filters.pop('type'))
+    if 'started_after' in filters:
+        add('startdate >= ?', _format_date(filters.pop('started_after')))
+    if 'started_before' in filters:
+        add('startdate <= ?', _format_date(filters.pop('started_before')))
+    if 'ended_after' in filters:
+        add('enddate >= ?', _format_date(filters.pop('ended_after')))
+    if 'ended_before' in filters:
+        add('enddate <= ?', _format_date(filters.pop('ended_before')))
+    if 'airing_between' in filters:
+        start, end = filters.pop('airing_between')
+        add('startdate <= ? AND (enddate IS NULL OR enddate >= ?)',
+            _format_date(end), _format_date(start))
+    if 'ongoing' in filters:
+        if filters.pop('ongoing'):
+            add('enddate IS NULL')
+        else:
+            add('enddate IS NOT NULL')
+    if 'min_episodes' in filters:
+        add('episodecount >= ?', filters.pop('min_episodes'))
+    if 'max_episodes' in filters:
+        add('episodecount <= ?', filters.pop('max_episodes'))
+    if filters:
+        raise TypeError(f'unknown filters: {", ".join(sorted(filters))}')
+    if not clauses:
+        return '', params
+    return ' WHERE ' + ' AND '.join(clauses), params
+
+
+def _format_date(date: 'Optional[date]') -> 'Optional[str]':
+    return None if date is None else date.isoformat()
@@ -0,0 +1,135 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Change events between Anime records.
+
+diff_anime compares two versions of an Anime and returns events
+describing what changed; diff_refresh does this for a batch of
+refreshed records.
+"""
+
+from typing import NamedTuple
+
+from mir.anidb.anime import Anime
+from mir.anidb.anime import Episode
+
+
+class AnimeAdded(NamedTuple):
+    aid: int
+    anime: Anime
+
+
+class FieldChanged(NamedTuple):
+    """The type or episodecount of an anime changed."""
+    aid: int
+    field: str
+    old: object
+    new: object
+
+
+class DatesChanged(NamedTuple):
+    """The startdate or enddate of an anime changed.
+
+    old and new are (startdate, enddate) tuples.
+    """
+    aid: int
+    old: 'Tuple[Optional[date], Optional[date]]'
+    new: 'Tuple[Optional[date], Optional[date]]'
+
+
+class TitlesChanged(NamedTuple):
+    aid: int
+    old: 'Tuple[AnimeTitle]'
+    new: 'Tuple[AnimeTitle]'
+
+
+class EpisodeAdded(NamedTuple):
+    aid: int
+    episode: Episode
+
+
+class EpisodeRemoved(NamedTuple):
+    aid: int
+    episode: Episode
+
+
+class EpisodeChanged(NamedTuple):
+    """An episode with the same epno changed, e.g. its titles."""
+    aid: int
+    old: Episode
+    new: Episode
+
+
+def diff_anime(old: Anime, new: Anime) -> 'List[NamedTuple]':
+    """Return change events from old to new.
+
+    Episodes are matched by epno.  Anime and episode titles are
+    compared as sets, so reordering alone is not a change.  Returns an
+    empty list if nothing changed.
+    """
+    if old.aid != new.aid:
+        raise ValueError(f'aid mismatch: {old.aid} != {new.aid}')
+    if old == new:
+        return []
+    aid = new.aid
+    events = []
+    for field in ('type', 'episodecount'):
+        old_value = getattr(old, field)
+        new_value = getattr(new, field)
+        if old_value != new_value:
+            events.append(FieldChanged(aid, field, old_value, new_value))
+    old_dates = (old.startdate, old.enddate)
+    new_dates = (new.startdate, new.enddate)
+    if old_dates != new_dates:
+        events.append(DatesChanged(aid, old_dates, new_dates))
+    if set(old.titles) != set(new.titles):
+        events.append(TitlesChanged(aid, old.titles, new.titles))
+    events.extend(_diff_episodes(aid, old.episodes, new.episodes))
+    return events
+
+
+def _diff_episodes(aid, old: 'Iterable[Episode]',
+                   new: 'Iterable[Episode]') -> 'Iterable[NamedTuple]':
+    old_episodes = {episode.epno: episode for episode in old}
+    new_episodes = {episode.epno: episode for episode in new}
+    for epno, episode in new_episodes.items():
+        old_episode = old_episodes.get(epno)
+        if old_episode is None:
+            yield EpisodeAdded(aid, episode)
+        elif _episode_key(old_episode) != _episode_key(episode):
+            yield EpisodeChanged(aid, old_episode, episode)
+    for epno, episode in old_episodes.items():
+        if epno not in new_episodes:
+            yield EpisodeRemoved(aid, episode)
+
+
+def _episode_key(episode: Episode) -> Episode:
+    """Return episode with its titles as a set, for comparison."""
+    return episode._replace(titles=frozenset(episode.titles))
+
+
+def diff_refresh(old, new: 'Iterable[Anime]') -> 'Iterable[NamedTuple]':
+    """Yield change events for a batch of refreshed Anime.
+
+    old is anything with a get(aid) method returning the previous Anime
+    or None, such as a dict or a catalog.Catalog.  Records not in old
+    yield AnimeAdded.  Records in old but not in new are not reported,
+    since a refresh may cover only part of the catalog.
+    """
+    for anime in new:
+        previous = old.get(anime.aid)
+        if previous is None:
+            yield AnimeAdded(anime.aid, anime)
+        else:
+            yield from diff_anime(previous, anime)
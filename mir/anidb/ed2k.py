@@ -0,0 +1,214 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""ED2K file hashing.
+
+AniDB identifies files by ED2K hash and size.  The file is split into
+9500 KiB chunks, each chunk is hashed with MD4, and the hash of a
+multi-chunk file is the MD4 of the concatenated chunk hashes.  Files
+whose size is an exact multiple of the chunk size are hashed without an
+extra empty chunk, which is what AniDB expects.
+
+https://wiki.anidb.net/w/Ed2k-hash
+
+MD4 is taken from hashlib if OpenSSL provides it, or else from
+pycryptodome (Crypto.Hash.MD4) if it is installed.  Otherwise a pure
+Python implementation is used, which is correct but orders of magnitude
+slower; a warning is logged on import in that case.  MD4_BACKEND names
+the implementation in use.
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+import struct
+from typing import NamedTuple
+import urllib.parse
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 9500 * 1024
+
+
+class FileHash(NamedTuple):
+    path: Path
+    size: int
+    ed2k: str
+
+
+def hash_file(path: 'PathLike') -> FileHash:
+    """Compute the ED2K hash of a file."""
+    path = Path(path)
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    chunk_hashes = []
+    size = 0
+    with path.open('rb', buffering=0) as file:
+        while True:
+            n = _read_chunk(file, view)
+            if n == 0 and chunk_hashes:
+                break
+            size += n
+            chunk_hashes.append(_md4(view[:n]).digest())
+            if n < CHUNK_SIZE:
+                break
+    if len(chunk_hashes) == 1:
+        digest = chunk_hashes[0]
+    else:
+        digest = _md4(b''.join(chunk_hashes)).digest()
+    return FileHash(path=path, size=size, ed2k=digest.hex())
+
+
+def _read_chunk(file, view: memoryview) -> int:
+    """Fill view from file, returning the number of bytes read."""
+    total = 0
+    while total < len(view):
+        n = file.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+def hash_files(paths: 'Iterable[PathLike]', processes: int = 0,
+               progress=None) -> 'List[FileHash]':
+    """Compute the ED2K hashes of many files with a process pool.
+
+    processes is the pool size (0 means one per CPU).  If progress is
+    given, it is called as progress(file_hash, done, total) as each file
+    finishes, in completion order.  Results are returned in the order of
+    paths.
+    """
+    paths = list(paths)
+    total = len(paths)
+    processes = processes or os.cpu_count() or 1
+    hashes = [None] * total
+    if processes == 1 or total <= 1:
+        for i, path in enumerate(paths):
+            hashes[i] = hash_file(path)
+            if progress is not None:
+                progress(hashes[i], i + 1, total)
+        return hashes
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures import as_completed
+    with ProcessPoolExecutor(min(processes, total)) as executor:
+        futures = {executor.submit(hash_file, path): i
+                   for i, path in enumerate(paths)}
+        for done, future in enumerate(as_completed(futures), 1):
+            file_hash = future.result()
+            hashes[futures[future]] = file_hash
+            if progress is not None:
+                progress(file_hash, done, total)
+    return hashes
+
+
+def ed2k_link(file_hash: FileHash) -> str:
+    """Format an ed2k:// link for a hashed file.
+
+    >>> ed2k_link(FileHash(Path('a b.mkv'), 0,
+    ...                    '31d6cfe0d16ae931b73c59d7e0c089c0'))
+    'ed2k://|file|a%20b.mkv|0|31d6cfe0d16ae931b73c59d7e0c089c0|/'
+    """
+    name = urllib.parse.quote(file_hash.path.name)
+    return f'ed2k://|file|{name}|{file_hash.size}|{file_hash.ed2k}|/'
+
+
+def _find_md4() -> 'Tuple[str, Callable]':
+    """Find the fastest available MD4 implementation."""
+    try:
+        hashlib.new('md4')
+    except ValueError:
+        pass
+    else:
+        return 'hashlib', lambda data=b'': hashlib.new('md4', data)
+    try:
+        from Crypto.Hash import MD4
+    except ImportError:
+        pass
+    else:
+        return 'pycryptodome', MD4.new
+    logger.warning('No fast MD4 implementation available; ED2K hashing'
+                   ' will be very slow.  Install pycryptodome to fix this.')
+    return 'python', _MD4
+
+
+class _MD4:
+
+    """Pure Python MD4 (RFC 1320), for when hashlib does not provide it.
+
+    >>> _MD4(b'abc').hexdigest()
+    'a448017aaf21d8525fc10ae87aa6729d'
+    """
+
+    def __init__(self, data=b''):
+        self._state = [0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476]
+        self._buffer = b''
+        self._length = 0
+        self.update(data)
+
+    def update(self, data):
+        data = self._buffer + bytes(data)
+        self._length += len(data) - len(self._buffer)
+        end = len(data) - len(data) % 64
+        for offset in range(0, end, 64):
+            self._state = _md4_compress(self._state, data[offset:offset + 64])
+        self._buffer = data[end:]
+
+    def digest(self) -> bytes:
+        padding = b'\x80' + b'\x00' * ((55 - self._length) % 64)
+        bit_length = struct.pack('<Q', self._length * 8 % 2**64)
+        tail = self._buffer + padding + bit_length
+        state = self._state
+        for offset in range(0, len(tail), 64):
+            state = _md4_compress(state, tail[offset:offset + 64])
+        return struct.pack('<4I', *state)
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+
+_MASK = 0xffffffff
+_ROUND2 = 0x5a827999
+_ROUND3 = 0x6ed9eba1
+
+
+def _rotl(v: int, s: int) -> int:
+    v &= _MASK
+    return (v << s | v >> (32 - s)) & _MASK
+
+
+def _md4_compress(state: 'List[int]', block: bytes) -> 'List[int]':
+    """Apply the MD4 compression function to one 64 byte block."""
+    x = struct.unpack('<16I', block)
+    a, b, c, d = state
+    for i in (0, 4, 8, 12):
+        a = _rotl(a + ((b & c) | (~b & d)) + x[i], 3)
+        d = _rotl(d + ((a & b) | (~a & c)) + x[i + 1], 7)
+        c = _rotl(c + ((d & a) | (~d & b)) + x[i + 2], 11)
+        b = _rotl(b + ((c & d) | (~c & a)) + x[i + 3], 19)
+    for i in (0, 1, 2, 3):
+        a = _rotl(a + ((b & c) | (b & d) | (c & d)) + x[i] + _ROUND2, 3)
+        d = _rotl(d + ((a & b) | (a & c) | (b & c)) + x[i + 4] + _ROUND2, 5)
+        c = _rotl(c + ((d & a) | (d & b) | (a & b)) + x[i + 8] + _ROUND2, 9)
+        b = _rotl(b + ((c & d) | (c & a) | (d & a)) + x[i + 12] + _ROUND2, 13)
+    for i in (0, 2, 1, 3):
+        a = _rotl(a + (b ^ c ^ d) + x[i] + _ROUND3, 3)
+        d = _rotl(d + (a ^ b ^ c) + x[i + 8] + _ROUND3, 9)
+        c = _rotl(c + (d ^ a ^ b) + x[i + 4] + _ROUND3, 11)
+        b = _rotl(b + (c ^ d ^ a) + x[i + 12] + _ROUND3, 15)
+    return [(s + v) & _MASK for s, v in zip(state, (a, b, c, d))]
+
+
+MD4_BACKEND, _md4 = _find_md4()
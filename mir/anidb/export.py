@@ -0,0 +1,144 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Streaming export of titles and anime data to JSONL and CSV.
+
+The row functions flatten records into dicts and the write functions
+consume rows one at a time, so iterables such as
+titles.iterparse_titles can be exported without loading the whole
+dataset into memory.
+"""
+
+import csv
+import gzip
+import json
+from pathlib import Path
+
+from mir.anidb.anime import get_episode_number
+from mir.anidb.anime import get_episode_title
+
+_BUFFER_SIZE = 1 << 20
+
+TITLE_FIELDS = ('aid', 'title', 'type', 'lang')
+ANIME_FIELDS = ('aid', 'type', 'episodecount', 'startdate', 'enddate')
+EPISODE_FIELDS = ('aid', 'epno', 'type', 'number', 'length', 'title')
+
+
+def title_rows(titles: 'Iterable[Titles]') -> 'Iterable[dict]':
+    """Flatten Titles into one row per AnimeTitle."""
+    for entry in titles:
+        for title in entry.titles:
+            yield {
+                'aid': entry.aid,
+                'title': title.title,
+                'type': title.type,
+                'lang': title.lang,
+            }
+
+
+def anime_rows(anime: 'Iterable[Anime]') -> 'Iterable[dict]':
+    """Flatten Anime into one row per anime, without titles or episodes."""
+    for record in anime:
+        yield {
+            'aid': record.aid,
+            'type': record.type,
+            'episodecount': record.episodecount,
+            'startdate': _format_date(record.startdate),
+            'enddate': _format_date(record.enddate),
+        }
+
+
+def anime_title_rows(anime: 'Iterable[Anime]') -> 'Iterable[dict]':
+    """Flatten Anime into one row per AnimeTitle."""
+    for record in anime:
+        for title in record.titles:
+            yield {
+                'aid': record.aid,
+                'title': title.title,
+                'type': title.type,
+                'lang': title.lang,
+            }
+
+
+def episode_rows(anime: 'Iterable[Anime]') -> 'Iterable[dict]':
+    """Flatten Anime into one row per Episode.
+
+    The title column is the preferred title from get_episode_title.
+    """
+    for record in anime:
+        for episode in record.episodes:
+            yield {
+                'aid': record.aid,
+                'epno': episode.epno,
+                'type': episode.type,
+                'number': get_episode_number(episode),
+                'length': episode.length,
+                'title': get_episode_title(episode),
+            }
+
+
+def write_jsonl(path: 'PathLike', rows: 'Iterable[dict]',
+                compress: bool = None) -> int:
+    """Write rows to a JSON Lines file.
+
+    The file is gzip compressed if compress is true, or if compress is
+    None and path ends with .gz.  Returns the number of rows written.
+    """
+    count = 0
+    with _open(path, compress) as file:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False))
+            file.write('\n')
+            count += 1
+    return count
+
+
+def write_csv(path: 'PathLike', rows: 'Iterable[dict]',
+              fieldnames: 'Sequence[str]', compress: bool = None) -> int:
+    """Write rows to a CSV file with a header.
+
+    Compression is handled as for write_jsonl.  Returns the number of
+    rows written.
+    """
+    count = 0
+    with _open(path, compress, newline='') as file:
+        writer = csv.DictWriter(file, fieldnames)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def _open(path, compress, newline=None):
+    """Open a buffered text file for writing, maybe gzip compressed."""
+    path = Path(path)
+    if compress is None:
+        compress = path.suffix == '.gz'
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline=newline)
+    return path.open('w', encoding='utf-8', newline=newline,
+                     buffering=_BUFFER_SIZE)
+
+
+def _format_date(date: 'Optional[date]') -> 'Optional[str]':
+    """Format a date for export.
+
+    >>> import datetime
+    >>> _format_date(datetime.date(1995, 10, 4))
+    '1995-10-04'
+    >>> _format_date(None) is None
+    True
+    """
+    return None if date is None else date.isoformat()
@@ -23,13 +23,17 @@ data.
 
 import abc
 import logging
+import os
 from pathlib import Path
-import pickle
+import re
+import time
 from typing import NamedTuple
 import warnings
 import xml.etree.ElementTree as ET
 
 from mir.anidb import api
+from mir.anidb._xmlns import XML
+from mir.anidb.anime import AnimeTitle
 from mir.anidb.anime import unpack_anime_title
 
 logger = logging.getLogger(__name__)
@@ -40,6 +44,30 @@ class Titles(NamedTuple):
     titles: 'Tuple[AnimeTitle]'
 
 
+class TitleFilter(NamedTuple):
+
+    """Predicates for titles, checked while parsing the titles XML.
+
+    Each field is a container of allowed values, or None to allow
+    anything.  Titles that do not match are skipped without being
+    unpacked, and anime left with no titles are dropped.
+    """
+
+    langs: 'Optional[Container[str]]' = None
+    types: 'Optional[Container[str]]' = None
+    aids: 'Optional[Container[int]]' = None
+
+    def match_aid(self, aid: int) -> bool:
+        return self.aids is None or aid in self.aids
+
+    def match_title(self, type: str, lang: str) -> bool:
+        return ((self.langs is None or lang in self.langs)
+                and (self.types is None or type in self.types))
+
+    def _restricts_titles(self) -> bool:
+        return self.langs is not None or self.types is not None
+
+
 class CachedTitlesGetter:
 
     """Cached getter for work titles.
@@ -110,15 +138,115 @@ class PickleCache(Cache):
         return f'{cls}({str(self._path)!r})'
 
     def load(self) -> 'List[Titles]':
-        try:
-            with self._path.open('rb') as file:
-                return pickle.load(file)
-        except IOError:
-            raise CacheMissingError
+        return _load_pickle(self._path)
 
     def save(self, titles):
-        with self._path.open('wb') as file:
-            pickle.dump(titles, file, protocol=self._PROTOCOL)
+        _save_pickle(self._path, titles)
+
+
+def _load_pickle(path: Path) -> 'List[Titles]':
+    """Load titles from a pickle file.
+
+    Raises CacheMissingError if the file is missing or cannot be
+    unpickled, such as a file truncated by an interrupted write.
+    """
+    import pickle
+    try:
+        with path.open('rb') as file:
+            return pickle.load(file)
+    except IOError:
+        raise CacheMissingError
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+            IndexError, TypeError, ValueError) as e:
+        logger.warning('Ignoring corrupt titles cache %s: %s', path, e)
+        raise CacheMissingError from e
+
+
+def _save_pickle(path: Path, titles):
+    """Save titles to a pickle file.
+
+    The file is written under a temporary name and renamed into place,
+    so readers never see a partially written file.
+    """
+    import pickle
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with tmp.open('wb') as file:
+            pickle.dump(titles, file, protocol=PickleCache._PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+
+
+def load_titles_cache(path: 'PathLike', max_age: float = 86400,
+                      requester=None) -> 'List[Titles]':
+    """Load Titles from a pickle cache file, refreshing it if needed.
+
+    The cache is refreshed with requester (default request_titles) if it
+    is missing or older than max_age seconds.  Refreshes are coordinated
+    between processes with a lock file next to the cache, so only one
+    process makes the request.  While a refresh is in progress, other
+    processes return the stale cache if there is one, or wait for the
+    refresh to finish otherwise.
+    """
+    path = Path(path)
+    if requester is None:
+        requester = request_titles
+    titles = _load_fresh_pickle(path, max_age)
+    if titles is not None:
+        return titles
+    with _RefreshLock(path.with_name(f'{path.name}.lock')) as lock:
+        if not lock.acquire(blocking=False):
+            try:
+                return _load_pickle(path)
+            except CacheMissingError:
+                logger.info('Waiting for titles refresh by another process')
+                lock.acquire()
+        # Another process may have refreshed while we were waiting.
+        titles = _load_fresh_pickle(path, max_age)
+        if titles is not None:
+            return titles
+        logger.info('Refreshing titles cache %s', path)
+        titles = requester()
+        _save_pickle(path, titles)
+        return titles
+
+
+def _load_fresh_pickle(path: Path, max_age: float) -> 'Optional[List[Titles]]':
+    """Load a pickle cache if it exists and is younger than max_age."""
+    try:
+        if time.time() - path.stat().st_mtime >= max_age:
+            return None
+        return _load_pickle(path)
+    except (OSError, CacheMissingError):
+        return None
+
+
+class _RefreshLock:
+
+    """Advisory inter-process lock on a file, using flock."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = self._path.open('a')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+
+    def acquire(self, blocking=True) -> bool:
+        import fcntl
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(self._file, flags)
+        except BlockingIOError:
+            return False
+        return True
 
 
 def api_requester() -> 'List[Titles]':
@@ -127,10 +255,53 @@ def api_requester() -> 'List[Titles]':
     return request_titles()
 
 
-def request_titles() -> 'List[Titles]':
-    """Request Titles from AniDB API."""
-    etree = _request_titles_xml()
-    return list(_unpack_titles(etree))
+def request_titles(processes: int = None, deadline=None,
+                   title_filter: TitleFilter = None) -> 'List[Titles]':
+    """Request Titles from AniDB API.
+
+    If processes is given, the titles XML is parsed in parallel with
+    that many worker processes (0 means one per CPU).
+
+    If title_filter is given, only matching titles are unpacked.
+
+    deadline is a time.monotonic() value (see api.deadline_after)
+    covering the transfer and parsing.  api.RequestTimeoutError is
+    raised if it passes.
+    """
+    if processes is None and title_filter is None:
+        etree = _request_titles_xml(deadline)
+        result = list(_unpack_titles(etree))
+    elif processes is None:
+        response = api.titles_request(deadline=deadline)
+        result = _parse_titles_text(response.text, title_filter)
+    else:
+        response = api.titles_request(deadline=deadline)
+        result = _unpack_titles_parallel(response.text, processes,
+                                         title_filter)
+    api.check_deadline(deadline)
+    return result
+
+
+def download_titles(path: 'PathLike', title_filter: TitleFilter = None,
+                    **kwargs) -> 'List[Titles]':
+    """Download the titles dump to path and unpack Titles from it.
+
+    The download is resumable and checked before parsing; see
+    api.download_titles, which is passed the keyword arguments.
+    """
+    path = api.download_titles(path, **kwargs)
+    with _open_titles_file(path) as file:
+        return list(iterparse_titles(file, title_filter))
+
+
+def _open_titles_file(path: Path):
+    """Open a titles XML file for reading, decompressing it if gzipped."""
+    with path.open('rb') as file:
+        magic = file.read(2)
+    if magic != b'\x1f\x8b':
+        return path.open('rb')
+    import gzip
+    return gzip.open(path, 'rb')
 
 
 class CopyingRequester:
@@ -154,12 +325,109 @@ class CopyingRequester:
         return list(_unpack_titles(etree))
 
 
-def _request_titles_xml() -> ET.ElementTree:
+def _request_titles_xml(deadline=None) -> ET.ElementTree:
     """Request AniDB titles file."""
-    response = api.titles_request()
+    response = api.titles_request(deadline=deadline)
     return api.unpack_xml(response.text)
 
 
+def iterparse_titles(source,
+                     title_filter: TitleFilter = None) -> 'Iterable[Titles]':
+    """Incrementally unpack Titles from a titles XML file.
+
+    source is a filename or a binary file object.  Titles are built
+    directly from parser events without an element tree, so memory use
+    does not grow with the size of the file.  If title_filter is given,
+    only matching titles are unpacked.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            yield from iterparse_titles(file, title_filter)
+            return
+    builder = _TitlesBuilder(title_filter)
+    parser = ET.XMLParser(target=builder)
+    while True:
+        data = source.read(_READ_SIZE)
+        if not data:
+            break
+        parser.feed(data)
+        yield from builder.titles
+        builder.titles.clear()
+    parser.close()
+    yield from builder.titles
+
+
+_READ_SIZE = 1 << 16
+
+
+class _TitlesBuilder:
+
+    """XMLParser target that builds Titles from titles XML.
+
+    Completed Titles are appended to the titles attribute.  Titles not
+    matching the filter are skipped as soon as their start tag is seen.
+    """
+
+    def __init__(self, title_filter: TitleFilter = None):
+        self._filter = title_filter or TitleFilter()
+        self._drop_empty = self._filter._restricts_titles()
+        self.titles = []
+        self._depth = 0
+        self._error = None
+        self._aid = None
+        self._current = None
+        self._attrib = None
+        self._data = []
+
+    def start(self, tag, attrib):
+        self._depth += 1
+        if self._depth == 1 and tag == 'error':
+            self._error = []
+        elif tag == 'anime':
+            aid = int(attrib['aid'])
+            self._aid = aid
+            self._current = [] if self._filter.match_aid(aid) else None
+        elif (tag == 'title' and self._current is not None
+              and self._filter.match_title(attrib.get('type'),
+                                           attrib.get(f'{XML}lang'))):
+            self._attrib = attrib
+            self._data = []
+
+    def data(self, data):
+        if self._attrib is not None:
+            self._data.append(data)
+        elif self._error is not None:
+            self._error.append(data)
+
+    def end(self, tag):
+        self._depth -= 1
+        if tag == 'title' and self._attrib is not None:
+            self._current.append(AnimeTitle(
+                title=''.join(self._data) or None,
+                type=self._attrib.get('type'),
+                lang=self._attrib.get(f'{XML}lang'),
+            ))
+            self._attrib = None
+        elif tag == 'anime' and self._current is not None:
+            if self._current or not self._drop_empty:
+                self.titles.append(Titles(aid=self._aid,
+                                          titles=tuple(self._current)))
+            self._current = None
+
+    def close(self):
+        if self._error is not None:
+            raise api.APIError(''.join(self._error))
+        return self.titles
+
+
+def _parse_titles_text(text: str,
+                       title_filter: TitleFilter = None) -> 'List[Titles]':
+    """Unpack Titles from titles XML text without building a tree."""
+    parser = ET.XMLParser(target=_TitlesBuilder(title_filter))
+    parser.feed(text)
+    return parser.close()
+
+
 def _unpack_titles(etree: ET.ElementTree) -> 'Generator':
     """Unpack Titles from titles XML."""
     for anime in etree.getroot():
@@ -167,3 +435,66 @@ def _unpack_titles(etree: ET.ElementTree) -> 'Generator':
             aid=int(anime.get('aid')),
             titles=tuple(unpack_anime_title(title) for title in anime),
         )
+
+
+_ANIME_START = re.compile(r'<anime[\s>]')
+_CHUNKS_PER_PROCESS = 4
+
+
+def _unpack_titles_parallel(text: str, processes: int = 0,
+                            title_filter: TitleFilter = None) -> 'List[Titles]':
+    """Unpack Titles from titles XML text using a process pool.
+
+    The document is split into chunks at <anime> element boundaries
+    and each chunk is parsed in a separate process.  The result is in
+    document order, the same as _unpack_titles.
+    """
+    processes = processes or os.cpu_count() or 1
+    chunks = _split_titles_xml(text, processes * _CHUNKS_PER_PROCESS)
+    if processes == 1 or len(chunks) <= 1:
+        if title_filter is None:
+            return list(_unpack_titles(api.unpack_xml(text)))
+        return _parse_titles_text(text, title_filter)
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    with ProcessPoolExecutor(processes) as executor:
+        results = executor.map(
+            partial(_unpack_titles_chunk, title_filter=title_filter), chunks)
+        return [titles for chunk in results for titles in chunk]
+
+
+def _split_titles_xml(text: str, count: int) -> 'List[str]':
+    """Split titles XML text into about count chunks of <anime> elements.
+
+    Returns an empty list if the text has no <anime> elements.  The
+    document outside the <anime> elements is parsed to check that it is
+    well-formed, so truncated text raises ParseError as in the serial
+    path; the chunks themselves are checked when they are parsed.
+
+    >>> _split_titles_xml('<animetitles><anime aid="1"/><anime aid="2"/>'
+    ...                   '</animetitles>', 2)
+    ['<anime aid="1"/>', '<anime aid="2"/>']
+    >>> _split_titles_xml('<animetitles><anime aid="1"/>', 2)
+    Traceback (most recent call last):
+        ...
+    xml.etree.ElementTree.ParseError: missing </animetitles> closing tag
+    """
+    starts = [match.start() for match in _ANIME_START.finditer(text)]
+    if not starts:
+        return []
+    end = text.rfind('</animetitles>')
+    if end < starts[-1]:
+        raise ET.ParseError('missing </animetitles> closing tag')
+    ET.fromstring(text[:starts[0]] + text[end:])
+    step = -(-len(starts) // count)
+    bounds = starts[::step] + [end]
+    return [text[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+
+def _unpack_titles_chunk(chunk: str,
+                         title_filter: TitleFilter = None) -> 'List[Titles]':
+    """Unpack Titles from a chunk of <anime> elements."""
+    text = f'<animetitles>{chunk}</animetitles>'
+    if title_filter is None:
+        return list(_unpack_titles(ET.ElementTree(ET.fromstring(text))))
+    return _parse_titles_text(text, title_filter)
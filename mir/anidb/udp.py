@@ -0,0 +1,388 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""AniDB UDP API client.
+
+https://wiki.anidb.net/w/UDP_API_Definition
+
+Every request is sent with a tag, so several requests can be in flight
+at once and responses are matched to requests by tag rather than by
+arrival order.  Packets are paced to respect the flood protection
+limits.
+"""
+
+import collections
+import itertools
+import logging
+import socket
+import time
+from typing import NamedTuple
+
+from mir.anidb import api
+
+logger = logging.getLogger(__name__)
+
+SERVER = ('api.anidb.net', 9000)
+_PROTOVER = 3
+_MAX_PACKET = 1400
+
+LOGIN_ACCEPTED = 200
+LOGIN_ACCEPTED_NEW_VERSION = 201
+LOGGED_OUT = 203
+FILE = 220
+ANIME = 230
+NO_SUCH_FILE = 320
+NO_SUCH_ANIME = 330
+LOGIN_FIRST = 501
+INVALID_SESSION = 506
+
+
+class Response(NamedTuple):
+    """UDP API response.
+
+    rows holds the data lines after the status line, split into fields.
+    """
+    code: int
+    message: str
+    rows: 'Tuple[Tuple[str]]' = ()
+
+
+class UDPAPIError(api.APIError):
+    """AniDB UDP API error response."""
+
+
+class UDPTimeoutError(TimeoutError):
+    """No response to a UDP API request."""
+
+
+class UDPClient:
+
+    """AniDB UDP API client.
+
+    client is an api.Client.  server is the (host, port) of the API
+    server.  At most window requests are in flight at once.  Requests
+    without a response after timeout seconds are resent up to retries
+    times.
+
+    Packets are paced for AniDB's flood protection: after burst
+    packets, at most one packet is sent every interval seconds, and
+    once packets have been sent for sustained seconds without a break,
+    at most one every long_interval seconds.  See _Pacer.
+
+    session is an existing session key to reuse, e.g. the session
+    attribute of a previous client closed with close(logout=False).  A
+    new session is opened with AUTH when needed, and reopened as soon as
+    the server reports it as invalid.
+
+    UDPClient can be used as a context manager to log out and close
+    the socket.
+    """
+
+    def __init__(self, client: api.Client, username: str, password: str, *,
+                 server=SERVER, interval: float = 2, burst: int = 5,
+                 long_interval: float = 4, sustained: float = 60,
+                 window: int = 8, timeout: float = 10, retries: int = 1,
+                 session: str = None):
+        self._client = client
+        self._username = username
+        self._password = password
+        self._window = window
+        self._timeout = timeout
+        self._retries = retries
+        self.session = session
+        self._pacer = _Pacer(interval, burst, long_interval, sustained)
+        self._tags = (f't{n}' for n in itertools.count())
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.connect(server)
+
+    def __repr__(self):
+        cls = type(self).__qualname__
+        return f'<{cls} {self._client!r} session={self.session!r}>'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self, logout: bool = True):
+        """Close the socket, first logging out if logged in.
+
+        If logout is false, the session is left open so its key (the
+        session attribute) can be passed to another client.
+        """
+        try:
+            if logout and self.session is not None:
+                self.logout()
+        finally:
+            self._sock.close()
+
+    def auth(self):
+        """Open a new session."""
+        self.session = None
+        self._send_all([], in_session=True)
+
+    def logout(self):
+        """Close the current session."""
+        session, self.session = self.session, None
+        self._send_all([('LOGOUT', {'s': session})])
+
+    def request(self, command: str, **params) -> Response:
+        """Send a request in the current session.
+
+        Raises UDPTimeoutError if there is no response.
+        """
+        response = self.pipeline([(command, params)])[0]
+        if response is None:
+            raise UDPTimeoutError(command)
+        return response
+
+    def pipeline(self, requests: 'Iterable[Tuple[str, dict]]') -> 'List[Response]':
+        """Send (command, params) requests in the current session.
+
+        Requests are sent without waiting for earlier responses, subject
+        to pacing and the window.  Responses are returned in request
+        order, with None for requests that got no response after all
+        retries, so one lost request does not fail the whole batch.
+        """
+        return self._send_all(list(requests), in_session=True)
+
+    def files(self, hashes: 'Iterable[FileHash]', fmask: str,
+              amask: str) -> 'List[Response]':
+        """Look up files by ed2k.FileHash.
+
+        fmask and amask are hex strings as described in the FILE
+        command documentation.
+        """
+        return self.pipeline(
+            ('FILE', {'size': h.size, 'ed2k': h.ed2k,
+                      'fmask': fmask, 'amask': amask})
+            for h in hashes)
+
+    def anime(self, aids: 'Iterable[int]', amask: str) -> 'List[Response]':
+        """Look up anime by aid."""
+        return self.pipeline(
+            ('ANIME', {'aid': aid, 'amask': amask}) for aid in aids)
+
+    def _send_all(self, requests: 'List[Tuple[str, dict]]',
+                  in_session: bool = False) -> 'List[Response]':
+        """Send requests, matching responses to them by tag.
+
+        If in_session is true, requests are sent with the current
+        session key, and a session is opened first if there is none.
+        When a response reports the session as expired, sending stops
+        until a new session is opened, then the affected requests are
+        resent.  Each request is resent this way at most once.
+
+        The response to a request that times out on every attempt is
+        None.  Failing to open a session raises an exception.
+        """
+        responses = [None] * len(requests)
+        queue = collections.deque((i, 0) for i in range(len(requests)))
+        pending = {}
+        reauthed = set()
+        auth_in_flight = False
+        auth_attempts = 0
+
+        def needs_auth():
+            return in_session and self.session is None
+
+        def handle(received, expired):
+            nonlocal auth_in_flight, auth_attempts
+            for item in expired:
+                if item.index == _AUTH:
+                    auth_in_flight = False
+                    auth_attempts += 1
+                    if auth_attempts > self._retries:
+                        raise UDPTimeoutError('AUTH')
+                elif item.attempts >= self._retries:
+                    logger.warning('No response to %s request %d',
+                                   requests[item.index][0], item.index)
+                else:
+                    queue.appendleft((item.index, item.attempts + 1))
+            for item, response in received:
+                if item.index == _AUTH:
+                    auth_in_flight = False
+                    self._accept_auth(response)
+                elif (in_session and item.index not in reauthed
+                      and response.code in (LOGIN_FIRST, INVALID_SESSION)):
+                    reauthed.add(item.index)
+                    if item.session is not None and item.session == self.session:
+                        logger.info('Session expired, logging in again')
+                        self.session = None
+                    queue.appendleft((item.index, item.attempts))
+                else:
+                    responses[item.index] = response
+
+        while queue or pending or needs_auth():
+            if needs_auth() and not auth_in_flight:
+                self._send(pending, _AUTH, 0, 'AUTH', self._auth_params())
+                auth_in_flight = True
+            while queue and len(pending) < self._window and not needs_auth():
+                index, attempts = queue.popleft()
+                command, params = requests[index]
+                session = None
+                if in_session:
+                    session = self.session
+                    params = {**params, 's': session}
+                self._send(pending, index, attempts, command, params, session)
+                handle(*self._receive(pending, block=False))
+            if pending:
+                handle(*self._receive(pending, block=True))
+        return responses
+
+    def _auth_params(self) -> dict:
+        return {
+            'user': self._username,
+            'pass': self._password,
+            'protover': _PROTOVER,
+            'client': self._client.name,
+            'clientver': self._client.version,
+            'enc': 'UTF8',
+        }
+
+    def _accept_auth(self, response: Response):
+        if response.code not in (LOGIN_ACCEPTED, LOGIN_ACCEPTED_NEW_VERSION):
+            raise UDPAPIError(response.code, response.message)
+        self.session = response.message.split(' ', 1)[0]
+
+    def _send(self, pending, index, attempts, command, params, session=None):
+        tag = next(self._tags)
+        self._pacer.wait()
+        self._sock.send(_encode_request(command, {**params, 'tag': tag}))
+        pending[tag] = _Pending(index, attempts,
+                                time.monotonic() + self._timeout, session)
+
+    def _receive(self, pending, block: bool):
+        """Receive responses for pending requests.
+
+        If block is true, wait until a response arrives or a request
+        times out.  Returns a list of (pending, response) pairs and a
+        list of timed out requests; both are removed from pending.
+        """
+        received = []
+        while pending:
+            if block:
+                wait = min(p.deadline for p in pending.values())
+                self._sock.settimeout(max(wait - time.monotonic(), 0))
+            else:
+                self._sock.settimeout(0)
+            try:
+                data = self._sock.recv(_MAX_PACKET)
+            except (socket.timeout, BlockingIOError):
+                if not block:
+                    break
+                now = time.monotonic()
+                expired = [tag for tag, p in pending.items()
+                           if p.deadline <= now]
+                return received, [pending.pop(tag) for tag in expired]
+            tag, response = _decode_response(data)
+            if tag in pending:
+                received.append((pending.pop(tag), response))
+                block = False
+            elif tag is None and response.code >= 500:
+                raise UDPAPIError(response.code, response.message)
+            else:
+                logger.debug('Ignoring unexpected response %r', data)
+        return received, []
+
+
+_AUTH = -1
+
+
+class _Pending(NamedTuple):
+    index: int
+    attempts: int
+    deadline: float
+    session: 'Optional[str]' = None
+
+
+class _Pacer:
+
+    """Pace packets for AniDB flood protection.
+
+    Up to burst packets are sent without delay; after that packets are
+    at least interval seconds apart.  Once packets have been sent for
+    sustained seconds with no gap of idle_reset seconds or more, they
+    are at least long_interval seconds apart.  After such a gap the
+    burst allowance and the short interval apply again.
+    """
+
+    def __init__(self, interval: float, burst: int,
+                 long_interval: float = 4, sustained: float = 60,
+                 idle_reset: float = 600):
+        self._interval = interval
+        self._burst = burst
+        self._long_interval = long_interval
+        self._sustained = sustained
+        self._idle_reset = idle_reset
+        self._sent = 0
+        self._last = None
+        self._busy_since = None
+
+    def wait(self):
+        now = time.monotonic()
+        if self._last is None or now - self._last >= self._idle_reset:
+            self._sent = 0
+            self._busy_since = now
+        if self._sent >= self._burst:
+            if now - self._busy_since >= self._sustained:
+                interval = self._long_interval
+            else:
+                interval = self._interval
+            delay = self._last + interval - now
+            if delay > 0:
+                time.sleep(delay)
+        self._last = time.monotonic()
+        self._sent += 1
+
+
+def _encode_request(command: str, params: dict) -> bytes:
+    """Encode a UDP API request packet.
+
+    >>> _encode_request('FILE', {'size': 1, 'name': 'a&b'})
+    b'FILE size=1&name=a&amp;b'
+    """
+    query = '&'.join(f'{key}={_escape(str(value))}'
+                     for key, value in params.items())
+    return f'{command} {query}'.encode('utf-8')
+
+
+def _escape(value: str) -> str:
+    return value.replace('&', '&amp;').replace('\n', '<br />')
+
+
+def _decode_response(data: bytes) -> 'Tuple[Optional[str], Response]':
+    """Decode a UDP API response packet into its tag and Response.
+
+    >>> _decode_response(b't1 220 FILE\\n1|22|a`b\\n')
+    ('t1', Response(code=220, message='FILE', rows=(('1', '22', "a'b"),)))
+    >>> _decode_response(b'555 BANNED\\nleech')
+    (None, Response(code=555, message='BANNED', rows=(('leech',),)))
+    """
+    status, *lines = data.decode('utf-8').rstrip('\n').split('\n')
+    first, _, rest = status.partition(' ')
+    if first.isdigit():
+        tag = None
+        code, message = first, rest
+    else:
+        tag = first
+        code, _, message = rest.partition(' ')
+    rows = tuple(tuple(_unescape(field) for field in line.split('|'))
+                 for line in lines)
+    return tag, Response(code=int(code), message=message, rows=rows)
+
+
+def _unescape(value: str) -> str:
+    return value.replace('<br />', '\n').replace('`', "'")
@@ -45,4 +45,7 @@ setup(
     install_requires=[
         'requests~=2.23.0',
     ],
+    extras_require={
+        'ed2k': ['pycryptodome'],
+    },
 )
@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
 from unittest import mock
 
 import pytest
 
 from mir.anidb import anime
+from mir.anidb import api
 from mir.anidb.anime import AnimeTitle
 
 from . import testlib
@@ -27,7 +29,8 @@ def test_request_anime(test_xml, client):
     with mock.patch('mir.anidb.api.httpapi_request') as request:
         request.return_value = testlib.FakeResponse(xml)
         got = anime.request_anime(client, 22)
-    request.assert_called_once_with(client, request='anime', aid=22)
+    request.assert_called_once_with(client, request='anime', aid=22,
+                                    deadline=None)
     assert got == obj
 
 
@@ -37,7 +40,16 @@ def test_request_anime_bad(client):
         request.return_value = testlib.FakeResponse(xml)
         with pytest.raises(anime.MissingElementError):
             anime.request_anime(client, 22)
-    request.assert_called_once_with(client, request='anime', aid=22)
+    request.assert_called_once_with(client, request='anime', aid=22,
+                                    deadline=None)
+
+
+def test_request_anime_deadline_passed(test_xml, client):
+    xml, obj = test_xml
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        request.return_value = testlib.FakeResponse(xml)
+        with pytest.raises(api.RequestTimeoutError):
+            anime.request_anime(client, 22, deadline=time.monotonic() - 1)
 
 
 def test_get_episode_number():
@@ -58,6 +70,49 @@ def test_get_episode_title_fallback():
     assert got == 'Revival of Evangelion Extras Disc'
 
 
+def test_EpisodeIndex_get():
+    index = anime.EpisodeIndex(_TEST_ANIME)
+    assert index.get(2, 1) is _TEST_ANIME.episodes[1]
+    assert index.get(1, 1) is _TEST_ANIME.episodes[0]
+
+
+def test_EpisodeIndex_get_missing():
+    index = anime.EpisodeIndex(_TEST_ANIME)
+    assert index.get(1, 2) is None
+
+
+def test_EpisodeIndex_get_epno():
+    index = anime.EpisodeIndex(_TEST_ANIME)
+    assert index.get_epno('S1') is _TEST_ANIME.episodes[1]
+    assert index.get_epno('S2') is None
+
+
+def test_EpisodeIndex_episodes_of_type():
+    episodes = (
+        _TEST_ANIME.episodes[0]._replace(epno='10'),
+        _TEST_ANIME.episodes[0]._replace(epno='2'),
+        _TEST_ANIME.episodes[1],
+    )
+    index = anime.EpisodeIndex(_TEST_ANIME._replace(episodes=episodes))
+    assert index.episodes_of_type(1) == (episodes[1], episodes[0])
+    assert index.episodes_of_type(3) == ()
+    assert len(index) == 3
+
+
+def test_EpisodeIndex_title():
+    index = anime.EpisodeIndex(_TEST_ANIME)
+    got = index.title('S1')
+    assert got == 'Revival of Evangelion Extras Disc'
+    assert index.title('S2') is None
+
+
+def test_EpisodeIndex_episode_without_titles():
+    episodes = (_TEST_ANIME.episodes[0]._replace(titles=()),)
+    index = anime.EpisodeIndex(_TEST_ANIME._replace(episodes=episodes))
+    assert index.get_epno('1') is episodes[0]
+    assert index.title('1') is None
+
+
 def test_get_main_title():
     got = anime.get_main_title(_TEST_ANIME.titles)
     assert got == 'Shinseiki Evangelion'
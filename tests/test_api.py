@@ -12,10 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
+import http.server
+import io
+import socket
+import threading
+import time
 from unittest import mock
 import xml.etree.ElementTree as ET
 
 import pytest
+import requests
 import requests_mock
 
 from mir.anidb import api
@@ -30,6 +37,123 @@ def test_titles_request():
     assert got.text == 'ok'
 
 
+def test_download_titles(tmpdir):
+    data = gzip.compress(b'<animetitles></animetitles>')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, content=data,
+              headers={'Content-Length': str(len(data))})
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert got.read_bytes() == data
+    assert not (tmpdir / 'titles.xml.gz.part').exists()
+
+
+def test_download_titles_resumes(tmpdir):
+    data = gzip.compress(b'<animetitles>' + b' ' * 1000 + b'</animetitles>')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, [
+            {'body': _InterruptedReader(data[:10]),
+             'headers': {'Content-Length': str(len(data)), 'ETag': '"v1"'}},
+            {'content': data[10:], 'status_code': 206,
+             'headers': {'Content-Range':
+                         f'bytes 10-{len(data) - 1}/{len(data)}'}},
+        ])
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert m.request_history[1].headers['Range'] == 'bytes=10-'
+    assert m.request_history[1].headers['If-Range'] == '"v1"'
+    assert got.read_bytes() == data
+    assert not (tmpdir / 'titles.xml.gz.part.validator').exists()
+
+
+def test_download_titles_restarts_changed_dump(tmpdir):
+    old = gzip.compress(b'<animetitles>' + b' ' * 1000 + b'</animetitles>')
+    new = gzip.compress(b'<animetitles>' + b'x' * 1000 + b'</animetitles>')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, [
+            {'body': _InterruptedReader(old[:10]),
+             'headers': {'Content-Length': str(len(old)),
+                         'Last-Modified': 'Wed, 01 Jan 2020 00:00:00 GMT'}},
+            {'content': new, 'headers': {'Content-Length': str(len(new))}},
+        ])
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert (m.request_history[1].headers['If-Range']
+            == 'Wed, 01 Jan 2020 00:00:00 GMT')
+    assert got.read_bytes() == new
+
+
+def test_download_titles_resumes_part_file(tmpdir):
+    data = gzip.compress(b'<animetitles></animetitles>')
+    (tmpdir / 'titles.xml.gz.part').write_bytes(data[:5])
+    (tmpdir / 'titles.xml.gz.part.validator').write_text('"v1"')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, content=data[5:], status_code=206,
+              headers={'Content-Range': f'bytes 5-{len(data) - 1}/*'})
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert m.last_request.headers['If-Range'] == '"v1"'
+    assert got.read_bytes() == data
+
+
+def test_download_titles_part_file_without_validator(tmpdir):
+    data = gzip.compress(b'<animetitles></animetitles>')
+    (tmpdir / 'titles.xml.gz.part').write_bytes(b'junk')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, content=data)
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert 'Range' not in m.last_request.headers
+    assert got.read_bytes() == data
+
+
+def test_download_titles_server_ignores_range(tmpdir):
+    data = gzip.compress(b'<animetitles></animetitles>')
+    (tmpdir / 'titles.xml.gz.part').write_bytes(b'junk')
+    (tmpdir / 'titles.xml.gz.part.validator').write_text('"v1"')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, content=data)
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert m.last_request.headers['Range'] == 'bytes=4-'
+    assert got.read_bytes() == data
+
+
+def test_download_titles_truncated_gzip(tmpdir):
+    data = gzip.compress(b'<animetitles></animetitles>')[:-4]
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, content=data)
+        with pytest.raises(api.DownloadError):
+            api.download_titles(tmpdir / 'titles.xml.gz')
+    assert list(tmpdir.iterdir()) == []
+
+
+def test_download_titles_size_mismatch(tmpdir):
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, content=b'<animetitles/>',
+              headers={'Content-Length': '100'})
+        with pytest.raises(api.DownloadError):
+            api.download_titles(tmpdir / 'titles.xml')
+
+
+def test_download_titles_gives_up(tmpdir):
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, exc=requests.exceptions.ConnectionError)
+        with pytest.raises(api.DownloadError):
+            api.download_titles(tmpdir / 'titles.xml', retries=1)
+    assert m.call_count == 2
+
+
+def test_download_titles_client_error_not_retried(tmpdir):
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, status_code=404)
+        with pytest.raises(api.DownloadError):
+            api.download_titles(tmpdir / 'titles.xml', retries=3)
+    assert m.call_count == 1
+
+
+def test_download_titles_server_error_retried(tmpdir):
+    data = gzip.compress(b'<animetitles></animetitles>')
+    with requests_mock.Mocker() as m:
+        m.get(_TITLES_URL, [{'status_code': 503}, {'content': data}])
+        got = api.download_titles(tmpdir / 'titles.xml.gz')
+    assert got.read_bytes() == data
+
+
 def test_client_eq():
     assert api.Client('foo', 1) == api.Client('foo', 1)
 
@@ -45,6 +169,67 @@ def test_httpapi_request(client):
     assert got.text == 'ok'
 
 
+def test_httpapi_request_uses_client_timeout():
+    client = api.Client('foo', 1, timeout=(1, 2))
+    with requests_mock.Mocker() as m:
+        m.get('http://api.anidb.net:9001/httpapi', text='ok')
+        api.httpapi_request(client, request='anime')
+    assert m.last_request.timeout == (1, 2)
+
+
+def test_httpapi_request_with_deadline(client):
+    with requests_mock.Mocker() as m:
+        m.get('http://api.anidb.net:9001/httpapi', text='ok')
+        got = api.httpapi_request(client, request='anime',
+                                  deadline=api.deadline_after(60))
+    assert got.text == 'ok'
+    assert m.last_request.timeout[1] <= 30
+
+
+def test_httpapi_request_deadline_passed(client):
+    with requests_mock.Mocker() as m:
+        with pytest.raises(api.RequestTimeoutError):
+            api.httpapi_request(client, request='anime',
+                                deadline=api.deadline_after(-1))
+    assert not m.called
+
+
+def test_titles_request_timeout():
+    with requests_mock.Mocker() as m:
+        m.get('http://anidb.net/api/anime-titles.xml.gz',
+              exc=requests.exceptions.ReadTimeout)
+        with pytest.raises(api.RequestTimeoutError):
+            api.titles_request()
+
+
+@pytest.mark.parametrize('path', ['', 'stall'])
+def test_get_deadline_with_trickling_server(trickle_server, path):
+    start = time.monotonic()
+    with pytest.raises(api.RequestTimeoutError):
+        api._get(trickle_server + path, timeout=(5, 30),
+                 deadline=api.deadline_after(0.5))
+    assert time.monotonic() - start < 2
+
+
+@pytest.mark.parametrize('deadline', [None, 60])
+def test_titles_request_timeout_during_transfer(deadline):
+    if deadline is not None:
+        deadline = api.deadline_after(deadline)
+    with requests_mock.Mocker() as m:
+        m.get('http://anidb.net/api/anime-titles.xml.gz',
+              body=_StalledReader(b'<animetitles>'))
+        with pytest.raises(api.RequestTimeoutError):
+            api.titles_request(deadline=deadline)
+
+
+def test_titles_request_connection_error_not_timeout():
+    with requests_mock.Mocker() as m:
+        m.get('http://anidb.net/api/anime-titles.xml.gz',
+              exc=requests.exceptions.ConnectionError)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            api.titles_request()
+
+
 def test__check_for_errors():
     etree = ET.ElementTree(ET.fromstring('<error>Banned</error>'))
     with pytest.raises(api.APIError) as excinfo:
@@ -55,3 +240,68 @@ def test__check_for_errors():
 def test_unpack_xml():
     got = api.unpack_xml('<test></test>')
     assert isinstance(got, ET.ElementTree)
+
+
+_TITLES_URL = 'http://anidb.net/api/anime-titles.xml.gz'
+
+
+@pytest.fixture
+def trickle_server():
+    """Serve a response body one byte at a time, every 50 ms.
+
+    On /stall, the body is never sent.
+    """
+    stop = threading.Event()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            while not stop.wait(0.05):
+                if self.path == '/stall':
+                    continue
+                try:
+                    self.wfile.write(b'x')
+                    self.wfile.flush()
+                except OSError:
+                    return
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}/'
+    finally:
+        stop.set()
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+class _InterruptedReader(io.BytesIO):
+
+    """Response body that fails after its data is read."""
+
+    def read(self, *args):
+        data = super().read(*args)
+        if not data:
+            raise ConnectionResetError
+        return data
+
+
+class _StalledReader(io.BytesIO):
+
+    """Response body that times out after its data is read."""
+
+    def read(self, *args):
+        data = super().read(*args)
+        if not data:
+            raise socket.timeout('timed out')
+        return data
+
+    read1 = read
@@ -0,0 +1,100 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+from unittest import mock
+
+import pytest
+
+from mir.anidb import anime
+from mir.anidb import api
+from mir.anidb import archive
+
+from . import testlib
+
+
+def test_AnimeArchive_repr():
+    assert repr(archive.AnimeArchive('foo')) == "AnimeArchive('foo')"
+
+
+def test_request_anime_saves_to_archive(client, tmpdir):
+    xml = testlib.load_text('anime.xml')
+    arc = archive.AnimeArchive(tmpdir)
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        request.return_value = testlib.FakeResponse(xml)
+        anime.request_anime(client, 22, archive=arc)
+    entries = list(arc.entries())
+    assert [entry.aid for entry in entries] == [22]
+    assert archive.load_entry(entries[0]) == testlib.load_obj('anime.py')
+
+
+def test_request_anime_does_not_archive_errors(client, tmpdir):
+    arc = archive.AnimeArchive(tmpdir)
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        request.return_value = testlib.FakeResponse('<error>Banned</error>')
+        with pytest.raises(api.APIError):
+            anime.request_anime(client, 22, archive=arc)
+    assert list(arc.entries()) == []
+
+
+def test_AnimeArchive_latest(tmpdir):
+    arc = archive.AnimeArchive(tmpdir)
+    old = arc.save(22, 'old', _time(2019))
+    new = arc.save(22, 'new', _time(2020))
+    other = arc.save(23, 'other', _time(2018))
+    assert arc.latest() == {22: new, 23: other}
+    assert old in arc.entries()
+
+
+def test_AnimeArchive_entries_missing_dir(tmpdir):
+    assert list(archive.AnimeArchive(tmpdir / 'foo').entries()) == []
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_replay(tmpdir, processes):
+    arc = archive.AnimeArchive(tmpdir)
+    arc.save(11223, testlib.load_text('anime_ongoing.xml'))
+    arc.save(22, '<error>stale</error>', _time(2019))
+    arc.save(22, testlib.load_text('anime.xml'), _time(2020))
+    got = archive.replay(arc, processes=processes)
+    assert got == [testlib.load_obj('anime.py'),
+                   testlib.load_obj('anime_ongoing.py')]
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_replay_skips_bad_entries(tmpdir, processes, caplog):
+    arc = archive.AnimeArchive(tmpdir)
+    arc.save(22, testlib.load_text('anime.xml'))
+    arc.save(23, '<error>Banned</error>')
+    arc.save(24, testlib.load_text('anime_bad.xml'))
+    arc.save(25, '<anime')
+    bad = arc.save(26, '')
+    bad.path.write_bytes(b'not gzip')
+    got = archive.replay(arc, processes=processes)
+    assert got == [testlib.load_obj('anime.py')]
+    assert caplog.text.count('Skipping archived anime') == 4
+
+
+def test_AnimeArchive_save_converts_to_utc(tmpdir):
+    arc = archive.AnimeArchive(tmpdir)
+    tz = datetime.timezone(datetime.timedelta(hours=9))
+    fetched = datetime.datetime(2020, 1, 1, 9, tzinfo=tz)
+    arc.save(22, 'foo', fetched)
+    entry, = arc.entries()
+    assert entry.fetched == fetched
+    assert entry.path.name == '22_20200101T000000.000000Z.xml.gz'
+
+
+def _time(year):
+    return datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc)
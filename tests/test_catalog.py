@@ -0,0 +1,115 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import pytest
+
+from mir.anidb import catalog
+
+from . import testlib
+
+
+def test_Catalog_repr(tmpdir):
+    path = tmpdir / 'catalog.db'
+    with catalog.Catalog(path) as cat:
+        assert repr(cat) == f'Catalog({str(path)!r})'
+
+
+def test_Catalog_upsert_get(cat):
+    assert cat.get(22) == _EVA
+    assert cat.get(1) is None
+    assert len(cat) == 3
+
+
+def test_Catalog_upsert_replaces(cat):
+    cat.upsert([_EVA._replace(episodecount=27)])
+    assert cat.get(22).episodecount == 27
+    assert len(cat) == 3
+
+
+def test_Catalog_persists(tmpdir):
+    path = tmpdir / 'catalog.db'
+    with catalog.Catalog(path) as cat:
+        cat.upsert([_EVA])
+    with catalog.Catalog(path) as cat:
+        assert cat.get(22) == _EVA
+
+
+def test_Catalog_delete(cat):
+    cat.delete(22)
+    assert cat.get(22) is None
+
+
+def test_Catalog_query_type(cat):
+    assert cat.aids(type='TV Series') == [22, 11223]
+
+
+def test_Catalog_query_ongoing(cat):
+    assert list(cat.query(ongoing=True)) == [_BAHAMUT]
+    assert cat.aids(ongoing=False) == [22, 30000]
+
+
+def test_Catalog_query_episodes(cat):
+    assert cat.aids(min_episodes=25) == [22]
+    assert cat.aids(max_episodes=24) == [11223, 30000]
+
+
+def test_Catalog_query_airing_between(cat):
+    got = cat.aids(type='TV Series',
+                   airing_between=(datetime.date(2018, 1, 1),
+                                   datetime.date(2018, 12, 31)))
+    assert got == [11223]
+
+
+def test_Catalog_query_started(cat):
+    got = cat.aids(started_after=datetime.date(1996, 1, 1),
+                   started_before=datetime.date(2010, 1, 1))
+    assert got == [30000]
+
+
+def test_Catalog_query_ended(cat):
+    got = cat.aids(ended_after=datetime.date(2000, 1, 1))
+    assert got == [30000]
+    assert cat.aids(ended_before=datetime.date(2000, 1, 1)) == [22]
+
+
+def test_Catalog_query_unknown_filter(cat):
+    with pytest.raises(TypeError):
+        cat.aids(foo=1)
+    with pytest.raises(TypeError):
+        cat.query(foo=1)
+
+
+@pytest.mark.parametrize('name', ['started_after', 'ended_before', 'type',
+                                  'min_episodes'])
+def test_Catalog_query_none_filter(cat, name):
+    with pytest.raises(TypeError):
+        cat.aids(**{name: None})
+    with pytest.raises(TypeError):
+        cat.query(**{name: None})
+
+
+_EVA = testlib.load_obj('anime.py')
+_BAHAMUT = testlib.load_obj('anime_ongoing.py')
+_MOVIE = _EVA._replace(aid=30000, type='Movie', episodecount=1,
+                       startdate=datetime.date(2005, 1, 1),
+                       enddate=datetime.date(2005, 1, 1))
+
+
+@pytest.fixture
+def cat(tmpdir):
+    with catalog.Catalog(tmpdir / 'catalog.db') as cat:
+        assert cat.upsert([_BAHAMUT, _EVA, _MOVIE]) == 3
+        yield cat
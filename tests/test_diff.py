@@ -0,0 +1,92 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+
+import pytest
+
+from mir.anidb import diff
+from mir.anidb.anime import EpisodeTitle
+
+from . import testlib
+
+
+def test_diff_anime_unchanged():
+    assert diff.diff_anime(_EVA, _EVA) == []
+
+
+def test_diff_anime_aid_mismatch():
+    with pytest.raises(ValueError):
+        diff.diff_anime(_EVA, _BAHAMUT)
+
+
+def test_diff_anime_fields_and_dates():
+    new = _BAHAMUT._replace(episodecount=25,
+                            enddate=datetime.date(2017, 9, 30))
+    assert diff.diff_anime(_BAHAMUT, new) == [
+        diff.FieldChanged(11223, 'episodecount', 24, 25),
+        diff.DatesChanged(11223,
+                          (datetime.date(2017, 4, 8), None),
+                          (datetime.date(2017, 4, 8),
+                           datetime.date(2017, 9, 30))),
+    ]
+
+
+def test_diff_anime_titles():
+    new = _EVA._replace(titles=_EVA.titles[:1])
+    assert diff.diff_anime(_EVA, new) == [
+        diff.TitlesChanged(22, _EVA.titles, _EVA.titles[:1]),
+    ]
+
+
+def test_diff_anime_titles_reordered():
+    new = _EVA._replace(titles=_EVA.titles[::-1])
+    assert diff.diff_anime(_EVA, new) == []
+
+
+def test_diff_anime_episodes():
+    ep1, special = _EVA.episodes
+    changed = ep1._replace(
+        titles=ep1.titles + (EpisodeTitle(title='Angriff', lang='de'),))
+    added = ep1._replace(epno='2')
+    new = _EVA._replace(episodes=(changed, added))
+    assert diff.diff_anime(_EVA, new) == [
+        diff.EpisodeChanged(22, ep1, changed),
+        diff.EpisodeAdded(22, added),
+        diff.EpisodeRemoved(22, special),
+    ]
+
+
+def test_diff_anime_episode_titles_reordered():
+    ep1, special = _EVA.episodes
+    reordered = ep1._replace(
+        titles=(EpisodeTitle(title='Angriff', lang='de'),) + ep1.titles)
+    old = _EVA._replace(episodes=(
+        ep1._replace(titles=reordered.titles[::-1]), special))
+    new = _EVA._replace(episodes=(reordered, special))
+    assert diff.diff_anime(old, new) == []
+
+
+def test_diff_refresh():
+    new_bahamut = _BAHAMUT._replace(episodecount=25)
+    got = list(diff.diff_refresh({11223: _BAHAMUT},
+                                 [_EVA, new_bahamut, _BAHAMUT]))
+    assert got == [
+        diff.AnimeAdded(22, _EVA),
+        diff.FieldChanged(11223, 'episodecount', 24, 25),
+    ]
+
+
+_EVA = testlib.load_obj('anime.py')
+_BAHAMUT = testlib.load_obj('anime_ongoing.py')
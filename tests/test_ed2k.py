@@ -0,0 +1,95 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+import pytest
+
+from mir.anidb import ed2k
+
+
+@pytest.mark.parametrize('data,expected', [
+    (b'', '31d6cfe0d16ae931b73c59d7e0c089c0'),
+    (b'a', 'bde52cb31de33e46245e05fbdbd6fb24'),
+    (b'message digest', 'd9130a8164549fe818874806e1c7014b'),
+    (b'1234567890' * 8, 'e33b4ddc9c38f2199c3e7b164fcc0536'),
+])
+def test_MD4(data, expected):
+    assert ed2k._MD4(data).hexdigest() == expected
+
+
+def test_MD4_update():
+    md4 = ed2k._MD4()
+    for i in range(0, 80, 7):
+        md4.update((b'1234567890' * 8)[i:i + 7])
+    assert md4.hexdigest() == 'e33b4ddc9c38f2199c3e7b164fcc0536'
+
+
+def test_hash_file_empty(tmpdir):
+    path = tmpdir / 'empty'
+    path.write_bytes(b'')
+    got = ed2k.hash_file(path)
+    assert got == ed2k.FileHash(path, 0, '31d6cfe0d16ae931b73c59d7e0c089c0')
+
+
+def test_hash_file_single_chunk(tmpdir):
+    path = tmpdir / 'foo'
+    path.write_bytes(b'a')
+    assert ed2k.hash_file(path).ed2k == 'bde52cb31de33e46245e05fbdbd6fb24'
+
+
+@pytest.mark.parametrize('size', [64, 100])
+def test_hash_file_multiple_chunks(tmpdir, size):
+    data = bytes(range(size))
+    path = tmpdir / 'foo'
+    path.write_bytes(data)
+    with mock.patch.object(ed2k, 'CHUNK_SIZE', 32):
+        got = ed2k.hash_file(path)
+    chunk_hashes = b''.join(ed2k._MD4(data[i:i + 32]).digest()
+                            for i in range(0, size, 32))
+    assert got.size == size
+    assert got.ed2k == ed2k._MD4(chunk_hashes).hexdigest()
+
+
+def test_find_md4_fallback(caplog):
+    with mock.patch('hashlib.new', side_effect=ValueError), \
+            mock.patch.dict('sys.modules', {'Crypto.Hash': None}):
+        name, md4 = ed2k._find_md4()
+    assert name == 'python'
+    assert md4 is ed2k._MD4
+    assert 'very slow' in caplog.text
+
+
+def test_find_md4_pycryptodome():
+    pytest.importorskip('Crypto.Hash.MD4')
+    with mock.patch('hashlib.new', side_effect=ValueError):
+        name, md4 = ed2k._find_md4()
+    assert name == 'pycryptodome'
+    assert md4(b'abc').hexdigest() == 'a448017aaf21d8525fc10ae87aa6729d'
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_hash_files(tmpdir, processes):
+    paths = []
+    for i in range(3):
+        path = tmpdir / f'file{i}'
+        path.write_bytes(b'a' * i)
+        paths.append(path)
+    progress = mock.Mock()
+    got = ed2k.hash_files(paths, processes=processes, progress=progress)
+    assert got == [ed2k.hash_file(path) for path in paths]
+    calls = progress.call_args_list
+    assert [c[0][1:] for c in calls] == [(1, 3), (2, 3), (3, 3)]
+    assert sorted(c[0][0].path.name for c in calls) == [
+        'file0', 'file1', 'file2']
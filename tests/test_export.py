@@ -0,0 +1,93 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import gzip
+import json
+
+from mir.anidb import export
+
+from . import testlib
+
+
+def test_title_rows():
+    got = list(export.title_rows(testlib.load_obj('titles.py')))
+    assert got == [
+        {'aid': 22, 'title': 'Neon Genesis Evangelion',
+         'type': 'official', 'lang': 'en'},
+        {'aid': 22, 'title': 'Shinseiki Evangelion',
+         'type': 'main', 'lang': 'x-jat'},
+    ]
+
+
+def test_anime_rows():
+    got = list(export.anime_rows([_TEST_ANIME, _TEST_ANIME_ONGOING]))
+    assert got == [
+        {'aid': 22, 'type': 'TV Series', 'episodecount': 26,
+         'startdate': '1995-10-04', 'enddate': '1996-03-27'},
+        {'aid': 11223, 'type': 'TV Series', 'episodecount': 24,
+         'startdate': '2017-04-08', 'enddate': None},
+    ]
+
+
+def test_anime_title_rows():
+    got = list(export.anime_title_rows([_TEST_ANIME]))
+    assert [row['title'] for row in got] == [
+        'Shinseiki Evangelion', 'Neon Genesis Evangelion']
+
+
+def test_episode_rows():
+    got = list(export.episode_rows([_TEST_ANIME]))
+    assert got[1] == {'aid': 22, 'epno': 'S1', 'type': 2, 'number': 1,
+                      'length': 75,
+                      'title': 'Revival of Evangelion Extras Disc'}
+
+
+def test_write_jsonl(tmpdir):
+    path = tmpdir / 'titles.jsonl'
+    rows = export.title_rows(testlib.load_obj('titles.py'))
+    assert export.write_jsonl(path, rows) == 2
+    lines = path.read_text('utf-8').splitlines()
+    assert json.loads(lines[0])['title'] == 'Neon Genesis Evangelion'
+
+
+def test_write_jsonl_gzip(tmpdir):
+    path = tmpdir / 'episodes.jsonl.gz'
+    export.write_jsonl(path, export.episode_rows([_TEST_ANIME]))
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        row = json.loads(file.readline())
+    assert row['title'] == '使徒, 襲来'
+
+
+def test_write_csv(tmpdir):
+    path = tmpdir / 'anime.csv'
+    rows = export.anime_rows([_TEST_ANIME_ONGOING])
+    assert export.write_csv(path, rows, export.ANIME_FIELDS) == 1
+    with path.open(newline='') as file:
+        got = list(csv.DictReader(file))
+    assert got == [{'aid': '11223', 'type': 'TV Series',
+                    'episodecount': '24', 'startdate': '2017-04-08',
+                    'enddate': ''}]
+
+
+def test_write_csv_compress(tmpdir):
+    path = tmpdir / 'titles.csv'
+    rows = export.title_rows(testlib.load_obj('titles.py'))
+    export.write_csv(path, rows, export.TITLE_FIELDS, compress=True)
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as file:
+        assert file.readline() == 'aid,title,type,lang\r\n'
+
+
+_TEST_ANIME = testlib.load_obj('anime.py')
+_TEST_ANIME_ONGOING = testlib.load_obj('anime_ongoing.py')
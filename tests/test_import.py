@@ -0,0 +1,42 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import time regression checks.
+
+Import time itself is not measured, since that is too noisy to assert
+on; instead these check that heavy modules stay lazily imported.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+_MODULES = ['mir.anidb.anime', 'mir.anidb.api', 'mir.anidb.titles']
+_HEAVY = ['requests', 'urllib3', 'pickle']
+
+
+@pytest.mark.parametrize('module', _MODULES)
+def test_import_does_not_load_heavy_modules(module):
+    loaded = _run(f'import sys, {module}; '
+                  f'print(*[m for m in {_HEAVY!r} if m in sys.modules])')
+    assert loaded.stdout.strip() == ''
+
+
+def _run(code):
+    return subprocess.run(
+        [sys.executable, '-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True)
+
@@ -0,0 +1,118 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import pickle
+from unittest import mock
+
+from mir.anidb import __main__ as cli
+
+from . import testlib
+
+
+def test_warm_titles(tmpdir):
+    xml = testlib.load_text('titles.xml')
+    cache = tmpdir / 'titles.pickle'
+    with mock.patch('mir.anidb.api.titles_request') as request:
+        request.return_value = testlib.FakeResponse(xml)
+        assert cli.main(['warm-titles', str(cache)]) == 0
+    with cache.open('rb') as file:
+        assert pickle.load(file) == testlib.load_obj('titles.py')
+
+
+def test_warm_anime(tmpdir, capsys):
+    xml = testlib.load_text('anime.xml')
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        request.return_value = testlib.FakeResponse(xml)
+        got = cli.main(['warm-anime', str(tmpdir), '22', '--client', 'foo',
+                        '--clientver', '1', '--interval', '0'])
+    assert got == 0
+    with cli.anime_cache_path(tmpdir, 22).open('rb') as file:
+        assert pickle.load(file) == testlib.load_obj('anime.py')
+    assert [p.name for p in tmpdir.iterdir()] == ['22.pickle']
+    assert 'fetch: 1 items' in capsys.readouterr().out
+
+
+def test_warm_anime_skips_cached(tmpdir):
+    cli.anime_cache_path(tmpdir, 22).write_bytes(b'')
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        cli.main(['warm-anime', str(tmpdir), '22', '--client', 'foo',
+                  '--clientver', '1'])
+    request.assert_not_called()
+
+
+def test_warm_anime_stops_on_api_error(tmpdir):
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        request.return_value = testlib.FakeResponse(
+            '<error>Banned</error>')
+        got = cli.main(['warm-anime', str(tmpdir), '22', '23',
+                        '--client', 'foo', '--clientver', '1',
+                        '--interval', '0'])
+    assert got == 1
+    assert request.call_count == 1
+    assert list(tmpdir.iterdir()) == []
+
+
+def test_warm_anime_skips_unparsable(tmpdir):
+    xml = testlib.load_text('anime.xml')
+    with mock.patch('mir.anidb.api.httpapi_request') as request:
+        request.side_effect = [testlib.FakeResponse('<anime id="22"/>'),
+                               testlib.FakeResponse(xml)]
+        got = cli.main(['warm-anime', str(tmpdir), '21', '22',
+                        '--client', 'foo', '--clientver', '1',
+                        '--interval', '0'])
+    assert got == 1
+    assert not cli.anime_cache_path(tmpdir, 21).exists()
+    assert cli.anime_cache_path(tmpdir, 22).exists()
+
+
+def test_warm_anime_aids_from_stdin(tmpdir):
+    xml = testlib.load_text('anime.xml')
+    with mock.patch('mir.anidb.api.httpapi_request') as request, \
+            mock.patch('sys.stdin', io.StringIO('22\n')):
+        request.return_value = testlib.FakeResponse(xml)
+        cli.main(['warm-anime', str(tmpdir), '--client', 'foo',
+                  '--clientver', '1', '--interval', '0'])
+    assert cli.anime_cache_path(tmpdir, 22).exists()
+
+
+def test_search_titles_xml(capsys):
+    path = testlib._DATADIR / 'titles.xml'
+    assert cli.main(['search-titles', str(path), 'genesis']) == 0
+    out = capsys.readouterr().out
+    assert out == '22\tofficial\ten\tNeon Genesis Evangelion\n'
+
+
+def test_search_titles_pickle(tmpdir, capsys):
+    path = tmpdir / 'titles.pickle'
+    with path.open('wb') as file:
+        pickle.dump(testlib.load_obj('titles.py'), file)
+    cli.main(['search-titles', str(path), 'shinseiki'])
+    out = capsys.readouterr().out
+    assert out == '22\tmain\tx-jat\tShinseiki Evangelion\n'
+
+
+def test_bench(capsys):
+    path = testlib._DATADIR / 'titles.xml'
+    assert cli.main(['bench', str(path), '-n', '2']) == 0
+    out = capsys.readouterr().out
+    assert 'parse: 2 items' in out
+    assert 'cache load latency:' in out
+
+
+def test_RateLimiter_waits():
+    limiter = cli._RateLimiter(0.01)
+    limiter.wait()
+    limiter.wait()
+    assert limiter.waited > 0
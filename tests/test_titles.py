@@ -13,13 +13,17 @@
 # limitations under the License.
 
 import collections
+import gzip
 import io
+import threading
 import xml.etree.ElementTree as ET
 from unittest import mock
 
 import pytest
 
+from mir.anidb import api
 from mir.anidb import titles
+from mir.anidb.anime import AnimeTitle
 
 from . import testlib
 
@@ -78,6 +82,89 @@ def test_PickleCache_save_load(tmpdir):
     assert cache.load() == titles_list
 
 
+def test_PickleCache_save_leaves_no_temp_files(tmpdir):
+    cache = titles.PickleCache(tmpdir / 'foo')
+    cache.save(_TEST_TITLES)
+    assert [p.name for p in tmpdir.iterdir()] == ['foo']
+
+
+def test_load_titles_cache_missing(tmpdir):
+    path = tmpdir / 'titles.pickle'
+    requester = _StubRequester([_TEST_TITLES])
+    assert titles.load_titles_cache(path, requester=requester) == _TEST_TITLES
+    assert titles._load_pickle(path) == _TEST_TITLES
+
+
+@pytest.mark.parametrize('data', [b'\x80\x04\x95garbage', b''])
+def test_load_titles_cache_corrupt(tmpdir, data):
+    path = tmpdir / 'titles.pickle'
+    path.write_bytes(data)
+    requester = _StubRequester([_TEST_TITLES])
+    assert titles.load_titles_cache(path, requester=requester) == _TEST_TITLES
+    assert titles._load_pickle(path) == _TEST_TITLES
+
+
+def test_load_titles_cache_corrupt_while_locked(tmpdir):
+    path = tmpdir / 'titles.pickle'
+    path.write_bytes(b'\x80\x04\x95garbage')
+    requester = _StubRequester([])
+    with titles._RefreshLock(tmpdir / 'titles.pickle.lock') as lock:
+        assert lock.acquire()
+
+        def refresh():
+            titles._save_pickle(path, _TEST_TITLES)
+            lock.__exit__(None, None, None)
+
+        timer = threading.Timer(0.1, refresh)
+        timer.start()
+        got = titles.load_titles_cache(path, requester=requester)
+        timer.join()
+    assert got == _TEST_TITLES
+
+
+def test_load_titles_cache_fresh(tmpdir):
+    path = tmpdir / 'titles.pickle'
+    titles._save_pickle(path, mock.sentinel.cached)
+    requester = _StubRequester([])
+    got = titles.load_titles_cache(path, requester=requester)
+    assert got == mock.sentinel.cached
+
+
+def test_load_titles_cache_stale(tmpdir):
+    path = tmpdir / 'titles.pickle'
+    titles._save_pickle(path, mock.sentinel.cached)
+    requester = _StubRequester([_TEST_TITLES])
+    got = titles.load_titles_cache(path, max_age=0, requester=requester)
+    assert got == _TEST_TITLES
+
+
+def test_load_titles_cache_stale_while_locked(tmpdir):
+    path = tmpdir / 'titles.pickle'
+    titles._save_pickle(path, mock.sentinel.cached)
+    requester = _StubRequester([])
+    with titles._RefreshLock(tmpdir / 'titles.pickle.lock') as lock:
+        assert lock.acquire()
+        got = titles.load_titles_cache(path, max_age=0, requester=requester)
+    assert got == mock.sentinel.cached
+
+
+def test_load_titles_cache_waits_for_refresh(tmpdir):
+    path = tmpdir / 'titles.pickle'
+    requester = _StubRequester([])
+    with titles._RefreshLock(tmpdir / 'titles.pickle.lock') as lock:
+        assert lock.acquire()
+
+        def refresh():
+            titles._save_pickle(path, _TEST_TITLES)
+            lock.__exit__(None, None, None)
+
+        timer = threading.Timer(0.1, refresh)
+        timer.start()
+        got = titles.load_titles_cache(path, requester=requester)
+        timer.join()
+    assert got == _TEST_TITLES
+
+
 def test_api_requester(test_xml):
     xml, obj = test_xml
     with mock.patch('mir.anidb.api.titles_request') as request:
@@ -94,6 +181,57 @@ def test_request_titles(test_xml):
     assert got == obj
 
 
+def test_request_titles_parallel(test_xml):
+    xml, obj = test_xml
+    with mock.patch('mir.anidb.api.titles_request') as request:
+        request.return_value = testlib.FakeResponse(xml)
+        got = titles.request_titles(processes=2)
+    assert got == obj
+
+
+def test_request_titles_parallel_error():
+    with mock.patch('mir.anidb.api.titles_request') as request:
+        request.return_value = testlib.FakeResponse('<error>Banned</error>')
+        with pytest.raises(api.APIError):
+            titles.request_titles(processes=2)
+
+
+def test__unpack_titles_parallel():
+    xml = _make_titles_xml(50)
+    got = titles._unpack_titles_parallel(xml, 2)
+    assert got == list(titles._unpack_titles(ET.parse(io.StringIO(xml))))
+    assert [t.aid for t in got] == list(range(1, 51))
+
+
+def test_download_titles(test_xml, tmpdir):
+    xml, obj = test_xml
+    data = gzip.compress(xml.encode('utf-8'))
+    with mock.patch('mir.anidb.api.download_titles') as download:
+        path = tmpdir / 'titles.xml.gz'
+        path.write_bytes(data)
+        download.return_value = path
+        got = titles.download_titles(path, retries=1)
+    download.assert_called_once_with(path, retries=1)
+    assert got == obj
+
+
+def test_download_titles_uncompressed(test_xml, tmpdir):
+    xml, obj = test_xml
+    with mock.patch('mir.anidb.api.download_titles') as download:
+        path = tmpdir / 'titles.xml'
+        path.write_text(xml, 'utf-8')
+        download.return_value = path
+        got = titles.download_titles(path)
+    assert got == obj
+
+
+@pytest.mark.parametrize('size', [-1000, -40, -10])
+def test__unpack_titles_parallel_truncated(size):
+    xml = _make_titles_xml(50)[:size]
+    with pytest.raises(ET.ParseError):
+        titles._unpack_titles_parallel(xml, 2)
+
+
 def test_CopyingRequester_repr():
     requester = titles.CopyingRequester('tmp')
     assert repr(requester) == "CopyingRequester('tmp')"
@@ -124,6 +262,68 @@ def test__unpack_titles(test_xml):
     assert got == obj
 
 
+def test_iterparse_titles(test_xml):
+    xml, obj = test_xml
+    got = list(titles.iterparse_titles(io.BytesIO(xml.encode('utf-8'))))
+    assert got == obj
+
+
+def test_iterparse_titles_many():
+    xml = _make_titles_xml(10)
+    got = list(titles.iterparse_titles(io.BytesIO(xml.encode('utf-8'))))
+    assert got == list(titles._unpack_titles(ET.parse(io.StringIO(xml))))
+
+
+def test_iterparse_titles_path(tmpdir):
+    path = tmpdir / 'titles.xml'
+    path.write_text(_make_titles_xml(3), 'utf-8')
+    assert [t.aid for t in titles.iterparse_titles(path)] == [1, 2, 3]
+
+
+def test_iterparse_titles_filter():
+    xml = _make_titles_xml(3).encode('utf-8')
+    title_filter = titles.TitleFilter(langs={'en'}, aids={2, 3})
+    got = list(titles.iterparse_titles(io.BytesIO(xml), title_filter))
+    assert got == [
+        titles.Titles(aid=2, titles=(
+            AnimeTitle(title='T2', type='short', lang='en'),)),
+        titles.Titles(aid=3, titles=(
+            AnimeTitle(title='T3', type='short', lang='en'),)),
+    ]
+
+
+def test_iterparse_titles_filter_drops_empty():
+    xml = _make_titles_xml(3).encode('utf-8')
+    title_filter = titles.TitleFilter(types={'official'})
+    assert list(titles.iterparse_titles(io.BytesIO(xml), title_filter)) == []
+
+
+def test_request_titles_filter(test_xml):
+    xml, obj = test_xml
+    title_filter = titles.TitleFilter(langs={'x-jat'}, types={'main'})
+    with mock.patch('mir.anidb.api.titles_request') as request:
+        request.return_value = testlib.FakeResponse(xml)
+        got = titles.request_titles(title_filter=title_filter)
+    assert got == [titles.Titles(aid=22, titles=obj[0].titles[1:])]
+
+
+def test_request_titles_filter_error():
+    with mock.patch('mir.anidb.api.titles_request') as request:
+        request.return_value = testlib.FakeResponse('<error>Banned</error>')
+        with pytest.raises(api.APIError) as excinfo:
+            titles.request_titles(title_filter=titles.TitleFilter())
+    assert excinfo.value.args == ('Banned',)
+
+
+def test__unpack_titles_parallel_filter():
+    xml = _make_titles_xml(50)
+    title_filter = titles.TitleFilter(types={'main'}, aids=range(10, 20))
+    got = titles._unpack_titles_parallel(xml, 2, title_filter)
+    assert got == titles._parse_titles_text(xml, title_filter)
+    assert [t.aid for t in got] == list(range(10, 20))
+    assert all(len(t.titles) == 1 for t in got)
+
+
 _TEST_TITLES = testlib.load_obj('titles.py')
 
 
@@ -137,6 +337,17 @@ def test_xml(request):
     return xml, obj
 
 
+def _make_titles_xml(count):
+    anime = ''.join(
+        f'<anime aid="{aid}">'
+        f'<title type="main" xml:lang="x-jat">Title {aid}</title>'
+        f'<title type="short" xml:lang="en">T{aid}</title>'
+        '</anime>\n'
+        for aid in range(1, count + 1))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<animetitles>\n{anime}</animetitles>\n<!-- Created -->\n')
+
+
 class _FakeCache(titles.Cache):
 
     def __init__(self):
@@ -0,0 +1,258 @@
+# Copyright (C) 2020 Allen Li
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pathlib import Path
+import socket
+import threading
+
+import pytest
+
+from mir.anidb import ed2k
+from mir.anidb import udp
+
+
+def test_auth_and_logout(server, client):
+    with _make_udp_client(server, client) as udp_client:
+        udp_client.auth()
+        assert udp_client.session == 'sess1'
+    assert server.commands == ['AUTH', 'LOGOUT']
+
+
+def test_request_logs_in_first(server, client):
+    with _make_udp_client(server, client) as udp_client:
+        got = udp_client.request('ANIME', aid=22, amask='80')
+    assert got == udp.Response(udp.ANIME, 'ANIME', (('22',),))
+    assert server.commands == ['AUTH', 'ANIME', 'LOGOUT']
+
+
+def test_reuses_session(server, client):
+    with _make_udp_client(server, client, session='sess0') as udp_client:
+        udp_client.request('ANIME', aid=22, amask='80')
+    assert server.commands == ['ANIME', 'LOGOUT']
+
+
+def test_files_pipelined_out_of_order(server, client):
+    server.batch = 3
+    hashes = [ed2k.FileHash(Path('a'), size, f'{size:032x}')
+              for size in (1, 2, 3, 404)]
+    with _make_udp_client(server, client) as udp_client:
+        got = udp_client.files(hashes, fmask='0', amask='0')
+    assert got == [
+        udp.Response(udp.FILE, 'FILE', (('1', '22'),)),
+        udp.Response(udp.FILE, 'FILE', (('2', '22'),)),
+        udp.Response(udp.FILE, 'FILE', (('3', '22'),)),
+        udp.Response(udp.NO_SUCH_FILE, 'NO SUCH FILE'),
+    ]
+
+
+def test_anime_reauths_invalid_session(server, client):
+    server.expire_session = True
+    with _make_udp_client(server, client, session='old') as udp_client:
+        got = udp_client.anime([22, 23], amask='80')
+        assert udp_client.session == 'sess1'
+    assert [r.rows for r in got] == [(('22',),), (('23',),)]
+    assert server.commands == ['ANIME', 'ANIME', 'AUTH', 'ANIME', 'ANIME',
+                               'LOGOUT']
+
+
+def test_anime_reauths_before_sending_rest_of_batch(server, client):
+    server.expire_session = True
+    with _make_udp_client(server, client, session='old',
+                          window=1) as udp_client:
+        got = udp_client.anime([22, 23, 24], amask='80')
+    assert [r.code for r in got] == [udp.ANIME] * 3
+    assert server.commands == ['ANIME', 'AUTH', 'ANIME', 'ANIME', 'ANIME',
+                               'LOGOUT']
+
+
+def test_retries_dropped_packet(server, client):
+    server.drop = 1
+    with _make_udp_client(server, client, session='s') as udp_client:
+        got = udp_client.request('ANIME', aid=22, amask='80')
+    assert got.code == udp.ANIME
+
+
+def test_timeout(server, client):
+    server.drop = 2
+    udp_client = _make_udp_client(server, client, session='s')
+    with pytest.raises(udp.UDPTimeoutError):
+        udp_client.request('ANIME', aid=22, amask='80')
+    udp_client.close(logout=False)
+
+
+def test_pipeline_timeout_keeps_other_responses(server, client):
+    server.drop_aids = {'23'}
+    with _make_udp_client(server, client, session='s') as udp_client:
+        got = udp_client.anime([22, 23, 24], amask='80')
+    assert [r and r.code for r in got] == [udp.ANIME, None, udp.ANIME]
+    assert server.commands.count('ANIME') == 4
+
+
+def test_close_without_logout(server, client):
+    udp_client = _make_udp_client(server, client)
+    udp_client.auth()
+    udp_client.close(logout=False)
+    with _make_udp_client(server, client,
+                          session=udp_client.session) as udp_client:
+        udp_client.request('ANIME', aid=22, amask='80')
+    assert server.commands == ['AUTH', 'ANIME', 'LOGOUT']
+
+
+def test_untagged_error(server, client):
+    server.banned = True
+    udp_client = _make_udp_client(server, client, session='s')
+    with pytest.raises(udp.UDPAPIError) as excinfo:
+        udp_client.request('ANIME', aid=22, amask='80')
+    assert excinfo.value.args == (555, 'BANNED')
+    udp_client.close(logout=False)
+
+
+def test_Pacer(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('time.sleep', sleeps.append)
+    pacer = udp._Pacer(2, 2)
+    for _ in range(3):
+        pacer.wait()
+    assert len(sleeps) == 1
+    assert 0 < sleeps[0] <= 2
+
+
+def test_Pacer_long_interval_after_sustained_use(monkeypatch):
+    clock = _FakeClock(monkeypatch)
+    pacer = udp._Pacer(2, 1, long_interval=4, sustained=10)
+    pacer.wait()
+    for _ in range(5):
+        pacer.wait()
+    assert clock.sleeps == [2, 2, 2, 2, 2]
+    pacer.wait()
+    assert clock.sleeps[-1] == 4
+
+
+def test_Pacer_resets_after_idle(monkeypatch):
+    clock = _FakeClock(monkeypatch)
+    pacer = udp._Pacer(2, 2, long_interval=4, sustained=10, idle_reset=60)
+    for _ in range(10):
+        pacer.wait()
+    clock.now += 60
+    clock.sleeps.clear()
+    pacer.wait()
+    pacer.wait()
+    assert clock.sleeps == []
+    pacer.wait()
+    assert clock.sleeps == [2]
+
+
+class _FakeClock:
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        self.sleeps = []
+        monkeypatch.setattr('time.monotonic', lambda: self.now)
+        monkeypatch.setattr('time.sleep', self._sleep)
+
+    def _sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _make_udp_client(server, client, **kwargs):
+    return udp.UDPClient(client, 'user', 'pass', server=server.address,
+                         interval=0, long_interval=0, timeout=0.2,
+                         **kwargs)
+
+
+@pytest.fixture
+def server():
+    server = _FakeServer()
+    thread = threading.Thread(target=server.serve, daemon=True)
+    thread.start()
+    yield server
+    server.stop()
+    thread.join()
+
+
+class _FakeServer:
+
+    """Local stand-in for the AniDB UDP API server.
+
+    Replies to FILE requests are held until batch of them have arrived
+    and then sent in reverse order.
+    """
+
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(('127.0.0.1', 0))
+        self._sock.settimeout(0.05)
+        self.address = self._sock.getsockname()
+        self.commands = []
+        self.batch = 1
+        self.expire_session = False
+        self.drop = 0
+        self.drop_aids = set()
+        self.banned = False
+        self._held = []
+        self._sessions = 0
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def serve(self):
+        while not self._stopped:
+            try:
+                data, addr = self._sock.recvfrom(1400)
+            except socket.timeout:
+                self._flush()
+                continue
+            self._handle(data.decode('utf-8'), addr)
+        self._sock.close()
+
+    def _handle(self, packet, addr):
+        command, _, query = packet.partition(' ')
+        params = dict(pair.split('=', 1) for pair in query.split('&'))
+        tag = params['tag']
+        self.commands.append(command)
+        if self.drop:
+            self.drop -= 1
+            return
+        if params.get('aid') in self.drop_aids:
+            return
+        if self.banned:
+            self._send(addr, '555 BANNED')
+            return
+        if command == 'AUTH':
+            self._sessions += 1
+            self._send(addr, f'{tag} 200 sess{self._sessions} LOGIN ACCEPTED')
+        elif command == 'LOGOUT':
+            self._send(addr, f'{tag} 203 LOGGED OUT')
+        elif self.expire_session and not params['s'].startswith('sess'):
+            self._send(addr, f'{tag} 506 INVALID SESSION')
+        elif command == 'ANIME':
+            self._send(addr, f'{tag} 230 ANIME\n{params["aid"]}')
+        elif command == 'FILE':
+            if params['size'] == '404':
+                reply = f'{tag} 320 NO SUCH FILE'
+            else:
+                reply = f'{tag} 220 FILE\n{params["size"]}|22'
+            self._held.append((addr, reply))
+            if len(self._held) >= self.batch:
+                self._flush()
+
+    def _flush(self):
+        for addr, reply in reversed(self._held):
+            self._send(addr, reply)
+        self._held.clear()
+
+    def _send(self, addr, text):
+        self._sock.sendto(f'{text}\n'.encode('utf-8'), addr)